@@ -4,11 +4,76 @@ Handles OAuth authentication and API calls for eBay, Nextdoor, Edmunds, etc.
 """
 
 import os
-import requests
-from requests_oauthlib import OAuth2Session
-from typing import List, Dict, Optional
+import time
+from typing import List, Optional, Tuple, Callable, Awaitable
 import asyncio
-import httpx
+from http_client import fetch
+from vehicle import Vehicle
+
+# Treat tokens as expired this many seconds before the provider says they are
+TOKEN_EXPIRY_MARGIN = 60
+
+# Refresh in the background once this fraction of a token's lifetime has passed
+TOKEN_REFRESH_AT = 0.8
+
+# After a failed background refresh, keep serving the old token this long before retrying (seconds)
+TOKEN_RETRY_DELAY = 30
+
+# Lifetime assumed when the provider omits expires_in
+DEFAULT_TOKEN_TTL = 3600
+
+class TokenManager:
+    """
+    Process-level OAuth token cache.
+    Serves the cached token until shortly before it expires, refreshes it in
+    the background near the end of its lifetime, and shares a single refresh
+    among concurrent callers.
+    """
+    
+    def __init__(self, name: str, request_token: Callable[[], Awaitable[Optional[Tuple[str, int]]]]):
+        self.name = name
+        self._request_token = request_token
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._refresh_task = None
+    
+    async def get_token(self) -> Optional[str]:
+        now = time.monotonic()
+        
+        if self._token and now < self._expires_at:
+            if now >= self._refresh_at:
+                self._start_refresh()
+            return self._token
+        
+        # Shield so a cancelled search doesn't abort the refresh other callers wait on
+        return await asyncio.shield(self._start_refresh())
+    
+    def invalidate(self):
+        """Drop the cached token, e.g. after the API rejects it"""
+        self._token = None
+        self._expires_at = 0.0
+    
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return self._refresh_task
+    
+    async def _refresh(self) -> Optional[str]:
+        result = await self._request_token()
+        if not result:
+            # Keep serving the old token if it hasn't actually expired yet, retrying after a pause
+            now = time.monotonic()
+            self._refresh_at = now + TOKEN_RETRY_DELAY
+            return self._token if now < self._expires_at else None
+        
+        token, expires_in = result
+        now = time.monotonic()
+        self._token = token
+        self._expires_at = now + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+        self._refresh_at = now + expires_in * TOKEN_REFRESH_AT
+        print(f"{self.name} OAuth token refreshed (expires in {expires_in}s)")
+        return token
 
 class EbayAPIClient:
     """eBay Motors Finding API with OAuth 2.0 client credentials flow"""
@@ -18,15 +83,21 @@ class EbayAPIClient:
         self.client_secret = os.getenv('EBAY_CERT_ID')
         self.base_url = 'https://svcs.ebay.com/services/search/FindingService/v1'
         self.access_token = None
+        self.tokens = TokenManager('eBay', self._request_token)
     
     def is_configured(self) -> bool:
         return bool(self.client_id and self.client_secret)
     
     async def get_access_token(self) -> Optional[str]:
-        """Get OAuth 2.0 access token"""
+        """Get a cached OAuth 2.0 access token, refreshing it when needed"""
         if not self.is_configured():
             return None
         
+        self.access_token = await self.tokens.get_token()
+        return self.access_token
+    
+    async def _request_token(self) -> Optional[Tuple[str, int]]:
+        """Run the client credentials flow, returning (token, expires_in)"""
         try:
             auth_url = 'https://api.ebay.com/identity/v1/oauth2/token'
             data = {
@@ -34,22 +105,22 @@ class EbayAPIClient:
                 'scope': 'https://api.ebay.com/oauth/api_scope'
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    auth_url,
-                    data=data,
-                    auth=(self.client_id, self.client_secret)
-                )
-                
-                if response.status_code == 200:
-                    self.access_token = response.json()['access_token']
-                    return self.access_token
+            response = await fetch(
+                auth_url,
+                method='POST',
+                data=data,
+                auth=(self.client_id, self.client_secret)
+            )
+            
+            if response.status_code == 200:
+                token = response.json()
+                return token['access_token'], int(token.get('expires_in', DEFAULT_TOKEN_TTL))
         except Exception as e:
             print(f"eBay OAuth error: {e}")
         
         return None
     
-    async def search_vehicles(self, params) -> List[Dict]:
+    async def search_vehicles(self, params) -> List[Vehicle]:
         """
         Search eBay Motors for vehicles matching criteria.
         Returns list of vehicle dicts.
@@ -70,28 +141,27 @@ class EbayAPIClient:
                 'itemFilter(0).value': str(params.maxPrice),
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.base_url, params=search_params)
+            response = await fetch(self.base_url, params=search_params)
+            
+            if response.status_code == 200:
+                data = response.json()
+                items = data.get('findItemsAdvancedResponse', [{}])[0].get('searchResult', [{}])[0].get('item', [])
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    items = data.get('findItemsAdvancedResponse', [{}])[0].get('searchResult', [{}])[0].get('item', [])
-                    
-                    vehicles = []
-                    for item in items[:20]:
-                        vehicle = {
-                            'id': item.get('itemId', [''])[0],
-                            'source': 'eBay Motors',
-                            'title': item.get('title', [''])[0],
-                            'price': int(float(item.get('sellingStatus', [{}])[0].get('currentPrice', [{}])[0].get('__value__', 0))),
-                            'location': item.get('location', [''])[0],
-                            'url': item.get('viewItemURL', [''])[0],
-                            'imageUrl': item.get('galleryURL', [''])[0],
-                            'timestamp': item.get('listingInfo', [{}])[0].get('startTime', [''])[0]
-                        }
-                        vehicles.append(vehicle)
-                    
-                    return vehicles
+                vehicles = []
+                for item in items[:20]:
+                    vehicle = Vehicle(
+                        id=item.get('itemId', [''])[0],
+                        source='eBay Motors',
+                        title=item.get('title', [''])[0],
+                        price=int(float(item.get('sellingStatus', [{}])[0].get('currentPrice', [{}])[0].get('__value__', 0))),
+                        location=item.get('location', [''])[0],
+                        url=item.get('viewItemURL', [''])[0],
+                        imageUrl=item.get('galleryURL', [''])[0],
+                        timestamp=item.get('listingInfo', [{}])[0].get('startTime', [''])[0]
+                    )
+                    vehicles.append(vehicle)
+                
+                return vehicles
         except Exception as e:
             print(f"eBay API search error: {e}")
         
@@ -108,7 +178,7 @@ class NextdoorAPIClient:
     def is_configured(self) -> bool:
         return bool(self.api_key)
     
-    async def search_marketplace(self, params) -> List[Dict]:
+    async def search_marketplace(self, params) -> List[Vehicle]:
         """
         Search Nextdoor marketplace for local vehicle listings.
         """
@@ -129,33 +199,32 @@ class NextdoorAPIClient:
                 'limit': 20
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f'{self.base_url}/marketplace/search',
-                    headers=headers,
-                    params=search_params
-                )
+            response = await fetch(
+                f'{self.base_url}/marketplace/search',
+                headers=headers,
+                params=search_params
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                items = data.get('results', [])
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    items = data.get('results', [])
-                    
-                    vehicles = []
-                    for item in items:
-                        vehicle = {
-                            'id': item.get('id'),
-                            'source': 'Nextdoor',
-                            'title': item.get('title'),
-                            'price': int(item.get('price', 0)),
-                            'location': item.get('neighborhood'),
-                            'url': item.get('url'),
-                            'imageUrl': item.get('photos', [{}])[0].get('url'),
-                            'description': item.get('description'),
-                            'timestamp': item.get('created_at')
-                        }
-                        vehicles.append(vehicle)
-                    
-                    return vehicles
+                vehicles = []
+                for item in items:
+                    vehicle = Vehicle(
+                        id=item.get('id'),
+                        source='Nextdoor',
+                        title=item.get('title'),
+                        price=int(item.get('price', 0)),
+                        location=item.get('neighborhood'),
+                        url=item.get('url'),
+                        imageUrl=item.get('photos', [{}])[0].get('url'),
+                        description=item.get('description'),
+                        timestamp=item.get('created_at')
+                    )
+                    vehicles.append(vehicle)
+                
+                return vehicles
         except Exception as e:
             print(f"Nextdoor API error: {e}")
         
@@ -170,15 +239,21 @@ class EdmundsAPIClient:
         self.client_secret = os.getenv('EDMUNDS_CLIENT_SECRET')
         self.base_url = 'https://api.edmunds.com/api/inventory/v2'
         self.access_token = None
+        self.tokens = TokenManager('Edmunds', self._request_token)
     
     def is_configured(self) -> bool:
         return bool(self.client_id and self.client_secret)
     
     async def get_access_token(self) -> Optional[str]:
-        """Get OAuth 2.0 access token"""
+        """Get a cached OAuth 2.0 access token, refreshing it when needed"""
         if not self.is_configured():
             return None
         
+        self.access_token = await self.tokens.get_token()
+        return self.access_token
+    
+    async def _request_token(self) -> Optional[Tuple[str, int]]:
+        """Run the client credentials flow, returning (token, expires_in)"""
         try:
             auth_url = 'https://api.edmunds.com/oauth/token'
             data = {
@@ -187,28 +262,28 @@ class EdmundsAPIClient:
                 'grant_type': 'client_credentials'
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(auth_url, data=data)
-                
-                if response.status_code == 200:
-                    self.access_token = response.json()['access_token']
-                    return self.access_token
+            response = await fetch(auth_url, method='POST', data=data)
+            
+            if response.status_code == 200:
+                token = response.json()
+                return token['access_token'], int(token.get('expires_in', DEFAULT_TOKEN_TTL))
         except Exception as e:
             print(f"Edmunds OAuth error: {e}")
         
         return None
     
-    async def search_inventory(self, params) -> List[Dict]:
+    async def search_inventory(self, params) -> List[Vehicle]:
         """
         Search Edmunds dealer inventory.
         Note: Requires dealer partnership account.
         """
-        if not await self.get_access_token():
+        access_token = await self.get_access_token()
+        if not access_token:
             return []
         
         try:
             headers = {
-                'Authorization': f'Bearer {self.access_token}'
+                'Authorization': f'Bearer {access_token}'
             }
             
             search_params = {
@@ -222,33 +297,42 @@ class EdmundsAPIClient:
             if params.model:
                 search_params['model'] = params.model
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f'{self.base_url}/inventories',
-                    headers=headers,
-                    params=search_params
-                )
+            response = await fetch(
+                f'{self.base_url}/inventories',
+                headers=headers,
+                params=search_params
+            )
+            
+            if response.status_code == 401:
+                # Token revoked early - fetch a fresh one next time
+                self.tokens.invalidate()
+            
+            if response.status_code == 200:
+                data = response.json()
+                items = data.get('results', [])
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    items = data.get('results', [])
-                    
-                    vehicles = []
-                    for item in items:
-                        vehicle = {
-                            'id': item.get('vin'),
-                            'source': 'Edmunds',
-                            'title': f"{item.get('year')} {item.get('make')} {item.get('model')}",
-                            'price': int(item.get('price', {}).get('total', 0)),
-                            'location': item.get('dealer', {}).get('city'),
-                            'url': item.get('link'),
-                            'imageUrl': item.get('photos', [{}])[0].get('url'),
-                            'timestamp': item.get('inventoryDate')
-                        }
-                        vehicles.append(vehicle)
-                    
-                    return vehicles
+                vehicles = []
+                for item in items:
+                    vehicle = Vehicle(
+                        id=item.get('vin'),
+                        source='Edmunds',
+                        title=f"{item.get('year')} {item.get('make')} {item.get('model')}",
+                        price=int(item.get('price', {}).get('total', 0)),
+                        location=item.get('dealer', {}).get('city'),
+                        url=item.get('link'),
+                        imageUrl=item.get('photos', [{}])[0].get('url'),
+                        timestamp=item.get('inventoryDate')
+                    )
+                    vehicles.append(vehicle)
+                
+                return vehicles
         except Exception as e:
             print(f"Edmunds API error: {e}")
         
         return []
+
+
+# Long-lived clients shared by every search so tokens and connections are reused
+ebay_client = EbayAPIClient()
+nextdoor_client = NextdoorAPIClient()
+edmunds_client = EdmundsAPIClient()
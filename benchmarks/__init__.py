@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the scraping pipeline.
+Run from the repository root, e.g. python -m benchmarks.bench_extract
+"""
@@ -0,0 +1,72 @@
+"""
+Compare the BeautifulSoup extraction path with the compiled lxml extractors.
+Usage: python -m benchmarks.bench_extract [--rounds N]
+"""
+
+import argparse
+import json
+import time
+from bs4 import BeautifulSoup
+from extractors import SiteExtractor, get_extractor
+from scrapers import extract_vehicle_data
+from sites_config import FULL_SITES, MAX_RESULTS_PER_SITE
+from benchmarks.fixtures import listing_page
+
+def soup_extract(page: str, site: dict) -> list:
+    """The original scraping path: full soup, select, select_one per field"""
+    soup = BeautifulSoup(page, 'lxml')
+    containers = soup.select(site['selectors']['container'])
+    vehicles = [
+        extract_vehicle_data(container, site['selectors'], site['name'])
+        for container in containers[:MAX_RESULTS_PER_SITE]
+    ]
+    return [vehicle for vehicle in vehicles if vehicle]
+
+def timed(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1000
+
+def comparable(vehicles: list) -> list:
+    return [{k: v for k, v in vehicle.to_dict().items() if k != 'timestamp'} for vehicle in vehicles]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    results = []
+    for site in FULL_SITES:
+        extractor = get_extractor(site)
+        if not isinstance(extractor, SiteExtractor):
+            continue  # Sites read from captured JSON have no HTML path
+
+        page = listing_page(site)
+
+        soup_ms = timed(lambda: soup_extract(page, site), args.rounds)
+        lxml_ms = timed(lambda: extractor.extract(page), args.rounds)
+        same = comparable(soup_extract(page, site)) == comparable(extractor.extract(page))
+
+        results.append({
+            'site': site['name'],
+            'page_bytes': len(page),
+            'soup_ms': round(soup_ms, 3),
+            'compiled_ms': round(lxml_ms, 3),
+            'speedup': round(soup_ms / lxml_ms, 1),
+            'same_output': same
+        })
+
+    total_soup = sum(r['soup_ms'] for r in results)
+    total_lxml = sum(r['compiled_ms'] for r in results)
+    print(json.dumps({
+        'benchmark': 'extract',
+        'rounds': args.rounds,
+        'sites': results,
+        'total_soup_ms': round(total_soup, 3),
+        'total_compiled_ms': round(total_lxml, 3),
+        'speedup': round(total_soup / total_lxml, 1)
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
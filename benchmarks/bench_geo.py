@@ -0,0 +1,117 @@
+"""
+Offline geocoding throughput: ZIP/place lookups, batch location resolving,
+vectorized haversine, radius filtering and nearest-N ZIP queries (grid
+index vs brute force). Uses a synthetic table the size of the Census ZCTA
+and places files, written in the same memory-mapped layout as data/geo.
+Usage: python -m benchmarks.bench_geo [--zips N] [--places N] [--rounds N]
+"""
+
+import argparse
+import contextlib
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+from geo import GeoIndex, haversine_miles, write_arrays
+from vehicle import Vehicle
+
+STATES = ['CA', 'TX', 'NY', 'FL', 'WA', 'IL', 'AZ', 'CO', 'GA', 'OH']
+
+def synthetic_table(path: str, zip_count: int, place_count: int, seed: int = 0):
+    """Random centroids over the contiguous US; returns (zip codes, place names)"""
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(99999, zip_count, replace=False) + 1
+    lats = rng.uniform(25, 49, zip_count)
+    lons = rng.uniform(-124, -67, zip_count)
+    zips = {int(code): (float(lat), float(lon)) for code, lat, lon in zip(codes, lats, lons)}
+
+    names = [f"town{i} {STATES[i % len(STATES)].lower()}" for i in range(place_count)]
+    places = {name: (float(rng.uniform(25, 49)), float(rng.uniform(-124, -67))) for name in names}
+
+    write_arrays(path, zips, places)
+    return [f"{code:05d}" for code in codes.tolist()], [f"Town{i}, {STATES[i % len(STATES)]}" for i in range(place_count)]
+
+def timed(fn, rounds: int) -> float:
+    """Median seconds of fn over rounds"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--zips', type=int, default=33000)
+    parser.add_argument('--places', type=int, default=30000)
+    parser.add_argument('--listings', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    results = {}
+
+    # GeoIndex logs with print(); keep stdout for the JSON results
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory() as path:
+        zip_codes, place_names = synthetic_table(path, args.zips, args.places)
+        geo = GeoIndex(path)
+
+        start = time.perf_counter()
+        geo.available
+        results['load_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+        # One location at a time, nothing cached
+        sample = [rng.choice(zip_codes) for _ in range(1000)] + [rng.choice(place_names) for _ in range(1000)]
+        def single_lookups():
+            geo._cache.clear()
+            for location in sample:
+                geo.point(location)
+        results['point_lookup_us'] = round(timed(single_lookups, args.rounds) / len(sample) * 1e6, 3)
+
+        # A batch of listing locations: half ZIPs, half 'City, ST'
+        locations = [
+            rng.choice(zip_codes) if i % 2 else rng.choice(place_names)
+            for i in range(args.listings)
+        ]
+        def cold_batch():
+            geo._cache.clear()
+            geo.locate(locations)
+        results['locate_batch_cold_per_sec'] = round(args.listings / timed(cold_batch, args.rounds))
+        results['locate_batch_warm_per_sec'] = round(args.listings / timed(lambda: geo.locate(locations), args.rounds))
+
+        points = np.random.default_rng(1).uniform([25, -124], [49, -67], (1_000_000, 2))
+        seconds = timed(lambda: haversine_miles(34.05, -118.24, points[:, 0], points[:, 1]), args.rounds)
+        results['haversine_points_per_sec'] = round(len(points) / seconds)
+
+        origin = geo.point(zip_codes[0])
+        vehicles = [Vehicle(str(i), 'Bench', 'car', 1000, location, '') for i, location in enumerate(locations[:1000])]
+        seconds = timed(lambda: geo.within_radius(list(vehicles), origin, 500), args.rounds)
+        results['within_radius_1k_ms'] = round(seconds * 1000, 3)
+
+        geo.grid  # Built once on first nearest query
+        coords = np.asarray(geo._load()['zip_coords'])
+        queries = [(rng.uniform(26, 48), rng.uniform(-123, -68)) for _ in range(500)]
+        def grid_queries():
+            for lat, lon in queries:
+                geo.nearest_zips(lat, lon, 10)
+        def brute_queries():
+            for lat, lon in queries:
+                miles = haversine_miles(lat, lon, coords[:, 0], coords[:, 1])
+                np.argpartition(miles, 10)[:10]
+        results['nearest10_grid_per_sec'] = round(len(queries) / timed(grid_queries, args.rounds))
+        results['nearest10_brute_force_per_sec'] = round(len(queries) / timed(brute_queries, args.rounds))
+
+    print(json.dumps({
+        'benchmark': 'geo',
+        'zips': args.zips,
+        'places': args.places,
+        'listings': args.listings,
+        'rounds': args.rounds,
+        'results': results
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
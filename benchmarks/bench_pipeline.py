@@ -0,0 +1,216 @@
+"""
+Offline replay benchmark for the scraping pipeline.
+Times build_search_url, the production extract call (page parse, extract
+and compiled filters, as scrape_page runs it), the compiled filter
+predicate and deduplicate_vehicles on every site's fixture, then runs the
+whole /api/search SSE path in-process against a local stub server replaying
+the fixtures (time to first result, total time, events/sec, peak RSS).
+No recordings are committed, so unless benchmarks.record_fixtures has been
+run the fixtures are synthetic pages built from each site's selectors; the
+'fixtures' field of the output says which were used.
+The app is served by uvicorn on a loopback socket so SSE frames are timed
+as a client receives them. Playwright sites are fetched as plain HTTP, so browser time is not included.
+No network is used; results go to stdout as JSON so runs can be compared,
+and the app's own logging goes to stderr.
+Usage: python -m benchmarks.bench_pipeline [--rounds N] [--modes fast,full] [--parse-pool]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import httpx
+import uvicorn
+from main import app, SearchParams
+from extractors import get_extractor
+from listing_index import listing_index
+from parse_pool import parse_pool
+from rate_limiter import rate_limiter
+from response_cache import response_cache
+from scrapers import build_search_url
+from search_cache import search_cache
+from sites_config import FULL_SITES
+from utils import compile_filters, deduplicate_vehicles
+from benchmarks.fixtures import recording_path, site_fixture
+from benchmarks.stub_server import StubServer
+
+FILTERED_PARAMS = SearchParams(
+    keyword='honda civic', location='Los Angeles, CA', maxPrice=30000,
+    minYear=2010, maxYear=2022, zipCode='90012', privateOnly=True
+)
+SEARCH_BODY = {'keyword': 'civic', 'location': 'Los Angeles, CA', 'maxPrice': 50000}
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def per_call_us(fn, calls: int, rounds: int) -> float:
+    """Median time of one call over rounds (fn runs calls times per round)"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) / calls * 1e6)
+    return round(statistics.median(timings), 3)
+
+def bench_build_search_url(rounds: int) -> dict:
+    calls = 1000
+    def run():
+        for _ in range(calls // len(FULL_SITES) + 1):
+            for site in FULL_SITES:
+                build_search_url(site, FILTERED_PARAMS)
+    return {'us_per_call': per_call_us(run, (calls // len(FULL_SITES) + 1) * len(FULL_SITES), rounds)}
+
+def fixture_pages() -> list:
+    return [(site, site_fixture(site, seed=seed)) for seed, site in enumerate(FULL_SITES)]
+
+def fixture_sources() -> dict:
+    recorded = [site['name'] for site in FULL_SITES if os.path.exists(recording_path(site))]
+    return {'recorded': recorded, 'synthetic': len(FULL_SITES) - len(recorded)}
+
+def bench_extract(pages: list, rounds: int) -> dict:
+    """get_extractor(site).extract with compiled filters, parse included, as scrape_page calls it"""
+    filters = compile_filters(FILTERED_PARAMS)
+    extractors = [(get_extractor(site), page) for site, page in pages]
+    def run():
+        for extractor, page in extractors:
+            extractor.extract(page, 1000, filters)
+    passed = sum(len(extractor.extract(page, 1000, filters)) for extractor, page in extractors)
+    return {'pages': len(pages), 'passed': passed, 'us_per_page': per_call_us(run, len(pages), rounds)}
+
+def fixture_vehicles(pages: list) -> list:
+    vehicles = []
+    for site, page in pages:
+        vehicles.extend(get_extractor(site).extract(page, 1000))
+    return vehicles
+
+def bench_filters(vehicles: list, rounds: int) -> dict:
+    """compile_filters once per search, then the predicate per listing"""
+    def run():
+        filters = compile_filters(FILTERED_PARAMS)
+        for vehicle in vehicles:
+            filters(vehicle)
+    passed = len(compile_filters(FILTERED_PARAMS).filter(vehicles))
+    return {'listings': len(vehicles), 'passed': passed, 'us_per_call': per_call_us(run, len(vehicles), rounds)}
+
+def bench_deduplicate(vehicles: list, rounds: int) -> dict:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        unique = deduplicate_vehicles(vehicles)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'listings': len(vehicles), 'unique': len(unique), 'ms': round(statistics.median(timings), 3)}
+
+async def run_search(client: httpx.AsyncClient, mode: str) -> dict:
+    search_cache.clear()  # Measure the scrape, not a cache replay
+    events = vehicles = size = 0
+    first_result = None
+    start = time.perf_counter()
+
+    async with client.stream('POST', '/api/search', json=dict(SEARCH_BODY, searchMode=mode)) as response:
+        async for line in response.aiter_lines():
+            if not line.startswith('data: '):
+                continue
+            events += 1
+            size += len(line)
+            event = json.loads(line[6:])
+            if event['type'] in ('result', 'results'):
+                vehicles += len(event['vehicles']) if event['type'] == 'results' else 1
+                if first_result is None:
+                    first_result = time.perf_counter() - start
+            elif event['type'] == 'error':
+                raise RuntimeError(event['message'])
+
+    total = time.perf_counter() - start
+    return {
+        'ttfr_ms': round((first_result or total) * 1000, 3),
+        'total_ms': round(total * 1000, 3),
+        'events': events,
+        'vehicles': vehicles,
+        'bytes': size,
+        'events_per_sec': round(events / total, 1),
+        'vehicles_per_sec': round(vehicles / total, 1)
+    }
+
+async def bench_sse(modes: list, rounds: int, use_parse_pool: bool) -> dict:
+    results = {}
+    with StubServer(FULL_SITES) as server, tempfile.TemporaryDirectory() as tmp:
+        # Point every site at the stub and keep all state in a scratch dir
+        for site in FULL_SITES:
+            site['base_url'] = server.base_url(site)
+            if site['method'] in ('playwright', 'playwright_json'):
+                site['method'] = 'requests'
+        rate_limiter.configure(server.host, {'per_second': 1e9, 'burst': 10 ** 9})
+        response_cache.directory = f"{tmp}/responses"
+        response_cache.fresh_for = 0
+        listing_index.path = f"{tmp}/listings.db"
+
+        if use_parse_pool:
+            await parse_pool.start()
+
+        # Lifespan off: no browsers or prefetching, the parse pool is handled above
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        server_config = uvicorn.Config(app, lifespan='off', log_level='warning')
+        app_server = uvicorn.Server(server_config)
+        serving = asyncio.create_task(app_server.serve(sockets=[sock]))
+        while not app_server.started:
+            await asyncio.sleep(0.01)
+
+        base_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await run_search(client, modes[0])  # Warm up imports, connections and the index
+
+            for mode in modes:
+                runs = [await run_search(client, mode) for _ in range(rounds)]
+                summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+                summary['stub_requests'] = server.requests
+                results[mode] = summary
+
+        app_server.should_exit = True
+        await serving
+        await parse_pool.stop()
+        listing_index.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--modes', default='fast,full')
+    parser.add_argument('--parse-pool', action='store_true', help='parse pages in the worker pool')
+    args = parser.parse_args()
+
+    rss_start = peak_rss_mb()
+    # The scrapers log with print(); keep stdout for the JSON results
+    with contextlib.redirect_stdout(sys.stderr):
+        pages = fixture_pages()
+        vehicles = fixture_vehicles(pages)
+        micro = {
+            'build_search_url': bench_build_search_url(args.rounds),
+            'extract': bench_extract(pages, args.rounds),
+            'filters': bench_filters(vehicles, args.rounds),
+            'deduplicate_vehicles': bench_deduplicate(vehicles, args.rounds),
+        }
+        sse = asyncio.run(bench_sse(args.modes.split(','), args.rounds, args.parse_pool))
+
+    print(json.dumps({
+        'benchmark': 'pipeline',
+        'rounds': args.rounds,
+        'python': sys.version.split()[0],
+        'parse_pool': args.parse_pool,
+        'fixtures': fixture_sources(),
+        'functions': micro,
+        'search_sse': sse,
+        'peak_rss_mb': {'start': rss_start, 'end': peak_rss_mb()}
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Compare SSE event encoding: the original dict vehicles + json.dumps f-string
+against Vehicle objects through sse.encode_event (orjson, and the stdlib
+fallback used when orjson is not installed).
+Usage: python -m benchmarks.bench_serialize [--listings N] [--rounds N]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import tracemalloc
+import sse
+from benchmarks.fixtures import MAKES, TRIMS, CITIES
+from vehicle import Vehicle
+
+def make_vehicles(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    vehicles = []
+    for i in range(count):
+        url = f"https://example.com/listing/{i}"
+        vehicles.append(Vehicle(
+            id=f"Example_{i:016x}",
+            source='Example',
+            title=f"{rng.randint(2005, 2024)} {rng.choice(MAKES)} {rng.choice(TRIMS)}",
+            price=rng.randint(2000, 60000),
+            location=rng.choice(CITIES),
+            url=url,
+            imageUrl=f"{url}/photo.jpg" if i % 2 else None,
+            timestamp='2024-01-01T12:00:00'
+        ))
+    return vehicles
+
+def dict_event(vehicle: dict) -> str:
+    """The original encoding in main.event_generator"""
+    return f"data: {json.dumps({'type': 'result', 'vehicle': vehicle})}\n\n"
+
+def encode_fallback(event) -> bytes:
+    """encode_event with orjson unavailable"""
+    return b'data: ' + sse._encoder.encode(event).encode() + b'\n\n'
+
+def measure(encode, events: list, rounds: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for event in events:
+            encode(event)
+    elapsed = (time.perf_counter() - start) / rounds
+
+    # Memory allocated at peak while encoding one event (median over 1000 events)
+    tracemalloc.start()
+    peaks = []
+    for event in events[:1000]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        encode(event)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        'total_ms': round(elapsed * 1000, 3),
+        'us_per_event': round(elapsed / len(events) * 1e6, 3),
+        'events_per_sec': int(len(events) / elapsed),
+        'peak_bytes_per_event': int(statistics.median(peaks))
+    }
+
+def bytes_per_listing(build, count: int) -> int:
+    tracemalloc.start()
+    listings = build(count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del listings
+    return size // count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--listings', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    vehicles = make_vehicles(args.listings)
+    dict_events = [vehicle.to_dict() for vehicle in vehicles]
+    events = [{'type': 'result', 'vehicle': vehicle} for vehicle in vehicles]
+
+    # Same payload either way
+    assert json.loads(dict_event(dict_events[0])[6:]) == json.loads(sse.encode_event(events[0])[6:])
+    assert json.loads(dict_event(dict_events[0])[6:]) == json.loads(encode_fallback(events[0])[6:])
+
+    results = {'json_dumps_dict': measure(dict_event, dict_events, args.rounds)}
+    if sse.orjson is not None:
+        results['encode_event_orjson'] = measure(sse.encode_event, events, args.rounds)
+    results['encode_event_fallback'] = measure(encode_fallback, events, args.rounds)
+
+    baseline = results['json_dumps_dict']['total_ms']
+    for result in results.values():
+        result['speedup'] = round(baseline / result['total_ms'], 1)
+
+    print(json.dumps({
+        'benchmark': 'serialize',
+        'listings': args.listings,
+        'rounds': args.rounds,
+        'orjson': sse.orjson is not None,
+        'bytes_per_listing': {
+            'dict': bytes_per_listing(lambda n: [v.to_dict() for v in make_vehicles(n)], args.listings),
+            'vehicle': bytes_per_listing(make_vehicles, args.listings)
+        },
+        'results': results
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
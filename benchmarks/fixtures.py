@@ -0,0 +1,126 @@
+"""
+Listing page fixtures for every site in sites_config.
+Recorded pages in benchmarks/recordings/ (see benchmarks.record_fixtures)
+are used when present. Otherwise synthetic pages are built from each site's
+selectors, with filler markup so parse cost resembles a real results page,
+or from its json_capture field map for sites scraped from API responses.
+"""
+
+import json
+import os
+import random
+import re
+from html import escape
+from typing import Dict
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), 'recordings')
+
+SELECTOR_PATTERN = re.compile(r'^(?P<tag>[\w-]+)?(?P<classes>(\.[\w-]+)*)(\[(?P<attr>[\w-]+)(="(?P<value>[^"]*)")?\])?$')
+
+MAKES = ['Honda Civic', 'Toyota Camry', 'Ford F-150', 'Tesla Model 3', 'BMW 330i', 'Chevy Malibu', 'Mazda 3']
+TRIMS = ['LX', 'EX', 'Sport', 'Touring', 'Base', 'Limited']
+CITIES = ['Los Angeles, CA', 'Pasadena, CA', 'Irvine, CA', 'Long Beach, CA', 'Santa Monica, CA']
+
+def element_for(selector: str, content: str, href: str = '') -> str:
+    """Render an element matching a simple tag/class/attribute selector"""
+    match = SELECTOR_PATTERN.match(selector.strip())
+    if not match:
+        raise ValueError(f"Unsupported selector: {selector}")
+
+    tag = match.group('tag') or 'div'
+    attrs = []
+    classes = match.group('classes')
+    if classes:
+        attrs.append(f'class="{" ".join(classes.strip(".").split("."))} extra"')
+    if match.group('attr'):
+        name, value = match.group('attr'), match.group('value')
+        attrs.append(f'{name}="{escape(value if value is not None else href or "x")}"')
+    if tag == 'a' and href and 'href=' not in ' '.join(attrs):
+        attrs.append(f'href="{escape(href)}"')
+
+    return f"<{tag} {' '.join(attrs)}>{content}</{tag}>"
+
+def listing_container(site: Dict, idx: int, rng: random.Random) -> str:
+    selectors = site['selectors']
+    year = rng.randint(2005, 2024)
+    title = f"{year} {rng.choice(MAKES)} {rng.choice(TRIMS)}"
+    price = f"${rng.randint(30, 450) * 100:,}"
+    href = f"/listing/{site['name'].lower().replace(' ', '-')}/{idx}"
+
+    fields = [
+        element_for(selectors['title'], escape(title)),
+        element_for(selectors['price'], price),
+        element_for(selectors['location'], f"({rng.choice(CITIES)})"),
+        element_for(selectors['url'], 'View listing', href),
+        '<div class="meta"><span class="badge">Great deal</span><img src="/i.jpg" alt=""></div>',
+    ]
+    return element_for(selectors['container'], ''.join(fields))
+
+def listing_page(site: Dict, listings: int = 60, filler: int = 400, seed: int = 0) -> str:
+    """Build a results page for site with the given number of listing containers"""
+    rng = random.Random(seed)
+    noise = ''.join(
+        f'<div class="nav-item n{i}"><a href="/c/{i}">Category {i}</a><p>Lorem ipsum dolor sit amet {i}</p></div>'
+        for i in range(filler)
+    )
+    containers = ''.join(listing_container(site, idx, rng) for idx in range(listings))
+    return (
+        '<!DOCTYPE html><html><head><title>Results</title>'
+        '<script>window.__data = {"a": 1};</script></head><body>'
+        f'<header>{noise[:len(noise) // 2]}</header><main><ul>{containers}</ul></main>'
+        f'<footer>{noise[len(noise) // 2:]}</footer></body></html>'
+    )
+
+def slug(site: Dict) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', site['name'].lower()).strip('-')
+
+def set_path(data: Dict, path: str, value):
+    """Set a dotted json_capture path inside nested dicts/lists, creating them as needed"""
+    parts = [int(part) if part.isdigit() else part for part in path.split('.')]
+    for part, following in zip(parts, parts[1:]):
+        empty = [] if isinstance(following, int) else {}
+        if isinstance(part, int):
+            while len(data) <= part:
+                data.append(empty)
+            data = data[part]
+        else:
+            data = data.setdefault(part, empty)
+    data[parts[-1]] = value
+
+def json_listing_page(site: Dict, listings: int = 60, seed: int = 0) -> str:
+    """Captured-responses page (JSON array of API payloads) for a playwright_json site"""
+    rng = random.Random(seed)
+    capture = site['json_capture']
+    values = {
+        'title': lambda idx: f"{rng.randint(2005, 2024)} {rng.choice(MAKES)} {rng.choice(TRIMS)}",
+        'price': lambda idx: str(rng.randint(30, 450) * 100),
+        'location': lambda idx: rng.choice(CITIES),
+        'imageUrl': lambda idx: f"https://img.example.com/{seed}/{idx}.jpg",
+        'url': lambda idx: f"https://example.com/{slug(site)}/{seed}/{idx}",
+        'id': lambda idx: f"{seed}{idx:06d}",
+    }
+
+    items = []
+    for idx in range(listings):
+        item = {}
+        for field, path in capture['fields'].items():
+            set_path(item, path, values.get(field, lambda idx: f"{field}-{idx}")(idx))
+        items.append(item)
+
+    payload = {}
+    set_path(payload, capture['items_path'], items)
+    return json.dumps([payload])
+
+def recording_path(site: Dict) -> str:
+    extension = 'json' if site.get('method') == 'playwright_json' else 'html'
+    return os.path.join(RECORDINGS_DIR, f"{slug(site)}.{extension}")
+
+def site_fixture(site: Dict, listings: int = 60, filler: int = 400, seed: int = 0) -> str:
+    """A recorded page for site if there is one, else a synthetic one"""
+    path = recording_path(site)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    if site.get('method') == 'playwright_json':
+        return json_listing_page(site, listings, seed)
+    return listing_page(site, listings, filler, seed)
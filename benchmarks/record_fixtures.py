@@ -0,0 +1,42 @@
+"""
+Save real pages from the on-disk response cache as benchmark recordings.
+Run a search against the live sites first (the normal app does this), then
+export the first results page of every site it cached - no network needed.
+Usage: python -m benchmarks.record_fixtures --keyword "honda civic" --location "Los Angeles, CA" --max-price 25000
+"""
+
+import argparse
+import os
+from types import SimpleNamespace
+from response_cache import response_cache
+from scrapers import build_search_url
+from sites_config import FULL_SITES
+from benchmarks.fixtures import RECORDINGS_DIR, recording_path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keyword', required=True)
+    parser.add_argument('--location', required=True)
+    parser.add_argument('--max-price', type=int, required=True)
+    parser.add_argument('--radius', type=int, default=50)
+    args = parser.parse_args()
+
+    params = SimpleNamespace(
+        keyword=args.keyword, location=args.location, maxPrice=args.max_price,
+        radius=args.radius, zipCode=None, make=None
+    )
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+
+    for site in FULL_SITES:
+        cached = response_cache.load(build_search_url(site, params))
+        if cached is None:
+            print(f"{site['name']}: not in the response cache, skipped")
+            continue
+
+        path = recording_path(site)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(cached.body)
+        print(f"{site['name']}: saved {len(cached.body)} bytes to {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Local HTTP server that replays site fixtures, for benchmarks that run the
+real fetch path without touching the network.
+Each site is served under /<site slug>/; result pages are derived from the
+site's fixture, seeded by the query string so paginated pages differ.
+"""
+
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from benchmarks.fixtures import slug, site_fixture
+
+class StubServer:
+    """Serves fixture pages for a list of sites on a random local port"""
+
+    def __init__(self, sites: List[Dict], listings: int = 60, filler: int = 400):
+        # Copies, so pages keep their format if the caller repoints the site configs
+        self.sites = {slug(site): dict(site) for site in sites}
+        self.listings = listings
+        self.filler = filler
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self._server.server_port}"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}"
+
+    def base_url(self, site: Dict) -> str:
+        return f"{self.url}/{slug(site)}"
+
+    def page(self, site_slug: str, query: str) -> bytes:
+        key = (site_slug, query)
+        with self._lock:
+            body = self._pages.get(key)
+            if body is None:
+                seed = zlib.crc32(query.encode())
+                body = self._pages[key] = site_fixture(
+                    self.sites[site_slug], self.listings, self.filler, seed
+                ).encode()
+        return body
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path, _, query = self.path.partition('?')
+                site_slug = path.strip('/').split('/')[0]
+                if site_slug not in stub.sites:
+                    self.send_error(404)
+                    return
+
+                stub.requests += 1
+                body = stub.page(site_slug, query)
+                json_site = stub.sites[site_slug].get('method') == 'playwright_json'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json' if json_site else 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,135 @@
+"""
+Process-wide Playwright browser pool.
+Keeps one warm Chromium per process and hands out isolated contexts/pages,
+capping how many pages are open at once and recycling the browser after
+a number of uses or when it crashes.
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+
+# Max pages open at once across all searches in this process
+BROWSER_MAX_PAGES = int(os.getenv('BROWSER_MAX_PAGES', '3'))
+
+# Relaunch Chromium after this many contexts to cap memory growth
+BROWSER_MAX_USES = int(os.getenv('BROWSER_MAX_USES', '50'))
+
+# Hard cap on each page's JS heap - a page that grows past it crashes instead of the container
+BROWSER_PAGE_MEMORY_MB = int(os.getenv('BROWSER_PAGE_MEMORY_MB', '512'))
+
+LAUNCH_ARGS = [
+    '--disable-dev-shm-usage',  # /dev/shm is tiny in most containers
+    '--disable-gpu',
+    '--no-zygote',
+    f'--js-flags=--max-old-space-size={BROWSER_PAGE_MEMORY_MB}',
+]
+
+class BrowserPool:
+    """Shared Chromium instance with bounded, isolated pages"""
+
+    def __init__(self, max_pages: int = BROWSER_MAX_PAGES, max_uses: int = BROWSER_MAX_USES):
+        self.max_pages = max_pages
+        self.max_uses = max_uses
+        self._playwright = None
+        self._browser = None
+        self._uses = 0
+        self._in_flight = {}  # browser -> open contexts
+        self._lock = asyncio.Lock()
+        self._pages = asyncio.Semaphore(max_pages)
+
+    async def start(self):
+        """Start Playwright and launch the first browser"""
+        async with self._lock:
+            await self._ensure_browser()
+
+    async def stop(self):
+        """Close every browser and stop Playwright"""
+        async with self._lock:
+            browsers = list(self._in_flight)
+            if self._browser and self._browser not in browsers:
+                browsers.append(self._browser)
+
+            for browser in browsers:
+                await self._close_browser(browser)
+
+            self._browser = None
+            self._in_flight.clear()
+
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+
+    @property
+    def open_pages(self) -> int:
+        return sum(self._in_flight.values())
+
+    async def _ensure_browser(self):
+        """Return a healthy browser, launching or recycling as needed (caller holds the lock)"""
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+
+        browser = self._browser
+        if browser and browser.is_connected() and self._uses < self.max_uses:
+            return browser
+
+        if browser:
+            reason = 'crashed' if not browser.is_connected() else f'reached {self._uses} uses'
+            print(f"Recycling browser ({reason})")
+            self._retire(browser)
+
+        self._browser = await self._playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        self._uses = 0
+        self._in_flight[self._browser] = 0
+        return self._browser
+
+    def _retire(self, browser):
+        """Close a replaced browser once its last context is done"""
+        if not self._in_flight.get(browser):
+            self._in_flight.pop(browser, None)
+            asyncio.create_task(self._close_browser(browser))
+
+    async def _close_browser(self, browser):
+        try:
+            if browser.is_connected():
+                await browser.close()
+        except Exception as e:
+            print(f"Error closing browser: {e}")
+
+    async def _acquire(self):
+        async with self._lock:
+            browser = await self._ensure_browser()
+            self._uses += 1
+            self._in_flight[browser] = self._in_flight.get(browser, 0) + 1
+            return browser
+
+    def _release(self, browser):
+        self._in_flight[browser] = self._in_flight.get(browser, 1) - 1
+        if browser is not self._browser:
+            self._retire(browser)
+
+    @asynccontextmanager
+    async def page(self, **context_options):
+        """
+        Yield a page in a fresh, isolated browser context.
+        Waits while max_pages pages are already open.
+        """
+        async with self._pages:
+            browser = await self._acquire()
+            try:
+                context = await browser.new_context(**context_options)
+                try:
+                    page = await context.new_page()
+                    page.on('crash', lambda _: print("Browser page crashed (out of memory?)"))
+                    yield page
+                finally:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass  # Context dies with a crashed browser
+            finally:
+                self._release(browser)
+
+
+browser_pool = BrowserPool()
@@ -0,0 +1,250 @@
+"""
+Precompiled per-site listing extractors.
+Each site's CSS selectors are translated to XPath and compiled once at
+import, pages are parsed with lxml directly, and extraction stops as soon
+as enough listings have been collected. Sites scraped through captured
+API responses get a JsonExtractor built from their declarative field map.
+"""
+
+import hashlib
+import json
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from cssselect import HTMLTranslator
+from lxml import etree, html as lxml_html
+from sites_config import FULL_SITES, MAX_RESULTS_PER_SITE
+from utils import extract_number, normalize_location
+from vehicle import Vehicle
+
+_translator = HTMLTranslator()
+
+# lxml refuses str input that declares its own encoding
+XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+def compile_selector(css: str, first: bool = False) -> etree.XPath:
+    """Compile a CSS selector to an XPath evaluated relative to an element"""
+    expression = _translator.css_to_xpath(css, prefix='descendant::')
+    if first:
+        # Like select_one: only the first match in document order
+        expression = f"({expression})[1]"
+    return etree.XPath(expression)
+
+def element_text(element) -> str:
+    """Equivalent of BeautifulSoup get_text(strip=True)"""
+    return ''.join(text.strip() for text in element.itertext())
+
+def stable_id(source: str, url: str) -> str:
+    """Listing id that stays the same across processes and restarts (unlike hash())"""
+    return f"{source}_{hashlib.sha1(url.encode()).hexdigest()[:16]}"
+
+def build_vehicle(source: str, title: str, price_text: str, location: str, url: str) -> Vehicle:
+    """Assemble a Vehicle from raw extracted strings"""
+    # Make URL absolute
+    if url and not url.startswith('http'):
+        url = 'https://' + url.lstrip('/')
+
+    return Vehicle(
+        id=stable_id(source, url),
+        source=source,
+        title=title,
+        price=extract_number(price_text),
+        location=normalize_location(location),
+        url=url,
+        timestamp=datetime.utcnow().isoformat()
+    )
+
+@dataclass(slots=True)
+class ExtractStats:
+    """What extract calls saw, for metrics: containers on the page and time spent in the filters"""
+    containers: int = 0
+    filter_seconds: float = 0.0
+
+    def add(self, other: 'ExtractStats'):
+        self.containers += other.containers
+        self.filter_seconds += other.filter_seconds
+
+def timed_predicate(predicate: Callable[[Vehicle], bool], stats: ExtractStats) -> Callable[[Vehicle], bool]:
+    """Wrap a filter predicate to add its running time to stats"""
+    clock = time.perf_counter
+
+    def check(vehicle: Vehicle) -> bool:
+        start = clock()
+        passed = predicate(vehicle)
+        stats.filter_seconds += clock() - start
+        return passed
+
+    return check
+
+class SiteExtractor:
+    """Compiled selectors for one site"""
+
+    def __init__(self, site: Dict):
+        selectors = site['selectors']
+        self.source = site['name']
+        self.container = compile_selector(selectors['container'])
+        self.title = compile_selector(selectors['title'], first=True)
+        self.price = compile_selector(selectors['price'], first=True)
+        self.location = compile_selector(selectors['location'], first=True)
+        self.url = compile_selector(selectors['url'], first=True)
+
+    def extract_one(self, container) -> Optional[Vehicle]:
+        """Extract every field from one container, or None if title/price are missing"""
+        title = self.title(container)
+        price = self.price(container)
+        if not title or not price:
+            return None
+
+        location = self.location(container)
+        url = self.url(container)
+
+        return build_vehicle(
+            self.source,
+            element_text(title[0]),
+            element_text(price[0]),
+            element_text(location[0]) if location else 'Unknown',
+            url[0].get('href', '') if url else ''
+        )
+
+    def containers(self, page: str) -> List:
+        if not page or not page.strip():
+            return []
+        declaration = XML_DECLARATION.match(page)
+        if declaration:
+            page = page[declaration.end():]
+        root = lxml_html.fromstring(page)
+        return self.container(root)
+
+    def extract(self, page: str, limit: int = MAX_RESULTS_PER_SITE,
+                predicate: Optional[Callable[[Vehicle], bool]] = None,
+                stats: Optional[ExtractStats] = None) -> List[Vehicle]:
+        """
+        Parse a page and return up to limit vehicles (that pass predicate, if given).
+        Stops walking containers once the limit is reached.
+        """
+        vehicles = []
+        containers = self.containers(page)
+        if stats is not None:
+            stats.containers += len(containers)
+            if predicate is not None:
+                predicate = timed_predicate(predicate, stats)
+
+        for container in containers:
+            try:
+                vehicle = self.extract_one(container)
+            except Exception as e:
+                print(f"Error extracting vehicle data: {e}")
+                continue
+
+            if vehicle and (predicate is None or predicate(vehicle)):
+                vehicles.append(vehicle)
+                if len(vehicles) >= limit:
+                    break
+
+        return vehicles
+
+def compile_path(path: str) -> tuple:
+    """Split a dotted JSON path ('data.items.0.title') into keys and list indexes"""
+    return tuple(int(part) if part.isdigit() else part for part in path.split('.') if part)
+
+def resolve_path(data, path: tuple):
+    """Follow a compiled path through nested dicts/lists, returning None if any step is missing"""
+    for part in path:
+        if isinstance(part, int):
+            data = data[part] if isinstance(data, list) and part < len(data) else None
+        else:
+            data = data.get(part) if isinstance(data, dict) else None
+        if data is None:
+            return None
+    return data
+
+class JsonExtractor:
+    """
+    Maps captured API JSON straight to Vehicles using a site's
+    'json_capture' config: 'items_path' to the listing array and a
+    'fields' map of vehicle field -> path inside each item.
+    """
+
+    def __init__(self, site: Dict):
+        capture = site['json_capture']
+        self.source = site['name']
+        self.items_path = compile_path(capture['items_path'])
+        self.fields = {field: compile_path(path) for field, path in capture['fields'].items()}
+        self.url_template = capture.get('url_template')
+
+    def extract_one(self, item: Dict) -> Optional[Vehicle]:
+        values = {field: resolve_path(item, path) for field, path in self.fields.items()}
+        if values.get('title') is None or values.get('price') is None:
+            return None
+
+        url = values.get('url')
+        if self.url_template:
+            url = self.url_template.format(**{k: '' if v is None else v for k, v in values.items()})
+
+        vehicle = build_vehicle(
+            self.source,
+            str(values['title']).strip(),
+            str(values['price']),
+            str(values.get('location') or 'Unknown'),
+            str(url or '')
+        )
+        if values.get('imageUrl'):
+            vehicle.imageUrl = values['imageUrl']
+        return vehicle
+
+    def extract(self, page: str, limit: int = MAX_RESULTS_PER_SITE,
+                predicate: Optional[Callable[[Vehicle], bool]] = None,
+                stats: Optional[ExtractStats] = None) -> List[Vehicle]:
+        """
+        Extract vehicles from a JSON array of captured response bodies.
+        Stops once limit vehicles (that pass predicate, if given) are found.
+        """
+        vehicles = []
+        if stats is not None and predicate is not None:
+            predicate = timed_predicate(predicate, stats)
+
+        try:
+            payloads = json.loads(page or '[]')
+        except ValueError as e:
+            print(f"Error decoding captured responses for {self.source}: {e}")
+            return vehicles
+
+        for payload in payloads:
+            items = resolve_path(payload, self.items_path)
+            if not isinstance(items, list):
+                continue
+            if stats is not None:
+                stats.containers += len(items)
+
+            for item in items:
+                try:
+                    vehicle = self.extract_one(item)
+                except Exception as e:
+                    print(f"Error extracting vehicle data: {e}")
+                    continue
+
+                if vehicle and (predicate is None or predicate(vehicle)):
+                    vehicles.append(vehicle)
+                    if len(vehicles) >= limit:
+                        return vehicles
+
+        return vehicles
+
+def make_extractor(site: Dict):
+    """Compile the right extractor for a site's scraping method"""
+    if site.get('method') == 'playwright_json':
+        return JsonExtractor(site)
+    return SiteExtractor(site)
+
+
+# Compiled once at startup for every configured site
+EXTRACTORS = {site['name']: make_extractor(site) for site in FULL_SITES}
+
+def get_extractor(site: Dict):
+    """Return the compiled extractor for a site, compiling it on first use if unknown"""
+    extractor = EXTRACTORS.get(site['name'])
+    if extractor is None:
+        extractor = EXTRACTORS[site['name']] = make_extractor(site)
+    return extractor
@@ -0,0 +1,384 @@
+"""
+Offline geocoding and radius filtering.
+ZIP code and place (city, state) centroids are built once from the Census
+Gazetteer files into flat NumPy arrays that every worker memory-maps, so
+the table costs no parsing at startup and its pages are shared. Listing
+locations are resolved in batches with searchsorted, filtered and sorted
+by a vectorized haversine distance from the search's ZIP code, and a grid
+index over the ZIP centroids answers nearest-N queries.
+Build the table with (the Railway build runs the first form):
+    python geo.py --download
+    python geo.py --zcta 2023_Gaz_zcta_national.txt --places 2023_Gaz_place_national.txt
+"""
+
+import argparse
+import csv
+import math
+import os
+import re
+import tempfile
+import zipfile
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+from vehicle import Vehicle
+
+# Directory holding the centroid arrays written by `python geo.py`
+GEO_DATA_PATH = os.getenv('GEO_DATA_PATH', 'data/geo')
+
+# Refuse to start without the centroid arrays (by default the server starts, with radius unenforced)
+GEO_REQUIRED = os.getenv('GEO_REQUIRED', '0') == '1'
+
+# Census Gazetteer archives fetched by `python geo.py --download`
+GAZETTEER_URL = 'https://www2.census.gov/geo/docs/maps-data/data/gazetteer/2023_Gazetteer/2023_Gaz_{kind}_national.zip'
+
+# Grid cell size for nearest-ZIP queries (degrees)
+GEO_GRID_CELL = float(os.getenv('GEO_GRID_CELL', '0.5'))
+
+# Keep listings whose location can't be placed when enforcing a radius
+GEO_KEEP_UNLOCATED = os.getenv('GEO_KEEP_UNLOCATED', '1') == '1'
+
+# Resolved location strings remembered per process
+GEO_CACHE_SIZE = int(os.getenv('GEO_CACHE_SIZE', '50000'))
+
+EARTH_RADIUS_MILES = 3958.8
+
+ZIP_PATTERN = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+WORD_PATTERN = re.compile(r'[a-z]+')
+
+# Trailing Gazetteer place types ('Los Angeles city' -> 'Los Angeles')
+PLACE_SUFFIX = re.compile(
+    r'\s+(city and borough|unified government|metropolitan government|consolidated government|'
+    r'city|town|village|borough|municipality|CDP|comunidad|zona urbana)(\s+\(balance\))?$'
+)
+
+ARRAY_FILES = ('zip_codes', 'zip_coords', 'place_keys', 'place_coords')
+
+def place_key(location: str) -> str:
+    """Lookup key for a place ('Irvine, CA' -> 'irvine ca'); the state must come last"""
+    return ' '.join(WORD_PATTERN.findall((location or '').lower()))
+
+def haversine_miles(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle miles from one point to arrays of points (degrees; NaN in, NaN out)"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats.astype(np.float64, copy=False))
+    dlat = lat2 - lat1
+    dlon = np.radians(lons.astype(np.float64, copy=False)) - math.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class ZipGrid:
+    """
+    Uniform lat/lon grid over points for nearest-N queries. Points are
+    sorted by cell so each cell is one contiguous slice; a query scans
+    rings of cells outward until nothing unseen can be closer.
+    """
+
+    def __init__(self, coords: np.ndarray, cell: float = GEO_GRID_CELL):
+        self.cell = cell
+        self.coords = coords
+        self.columns = int(math.ceil(360 / cell))
+        self.rows = int(math.ceil(180 / cell))
+
+        cells = self._cell_ids(coords[:, 0], coords[:, 1])
+        self.order = np.argsort(cells, kind='stable')
+        self.sorted_cells = cells[self.order]
+
+    def _cell_ids(self, lats, lons) -> np.ndarray:
+        rows = np.clip(((np.asarray(lats, dtype=np.float64) + 90) // self.cell).astype(np.int64), 0, self.rows - 1)
+        cols = ((np.asarray(lons, dtype=np.float64) + 180) // self.cell).astype(np.int64) % self.columns
+        return rows * self.columns + cols
+
+    def _ring(self, row: int, col: int, k: int) -> np.ndarray:
+        """Point indexes in the cells exactly k cells away from (row, col)"""
+        if k == 0:
+            offsets = [(0, 0)]
+        else:
+            offsets = [(dr, dc) for dr in (-k, k) for dc in range(-k, k + 1)]
+            offsets += [(dr, dc) for dr in range(-k + 1, k) for dc in (-k, k)]
+
+        ids = {
+            (row + dr) * self.columns + (col + dc) % self.columns
+            for dr, dc in offsets
+            if 0 <= row + dr < self.rows
+        }
+        if not ids:
+            return np.empty(0, dtype=np.int64)
+
+        ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        starts = np.searchsorted(self.sorted_cells, ids, 'left')
+        ends = np.searchsorted(self.sorted_cells, ids, 'right')
+        slices = [self.order[s:e] for s, e in zip(starts, ends) if e > s]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def nearest(self, lat: float, lon: float, n: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Indexes and miles of the n points nearest to (lat, lon), closest first"""
+        n = min(n, len(self.coords))
+        if n <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        row = min(max(int((lat + 90) // self.cell), 0), self.rows - 1)
+        col = int((lon + 180) // self.cell) % self.columns
+        found, miles = [], []
+        total = 0
+
+        for k in range(max(self.rows, self.columns)):
+            ring = self._ring(row, col, k)
+            if len(ring):
+                found.append(ring)
+                miles.append(haversine_miles(lat, lon, self.coords[ring, 0], self.coords[ring, 1]))
+                total += len(ring)
+            if total < n:
+                continue
+            if total >= len(self.coords):
+                break
+
+            # Unscanned cells are more than k cells away in latitude, or in longitude
+            # at the highest latitude they can be at (the smaller bound)
+            edge_lat = abs(lat) + (k + 1) * self.cell
+            bound = k * self.cell * 69.0 * math.cos(math.radians(edge_lat)) if edge_lat < 90 else 0.0
+            if np.partition(np.concatenate(miles), n - 1)[n - 1] <= bound:
+                break
+
+        candidates = np.concatenate(found)
+        distances = np.concatenate(miles)
+        best = np.argsort(distances)[:n]
+        return candidates[best], distances[best]
+
+class GeoIndex:
+    """Memory-mapped ZIP and place centroids with batch lookups"""
+
+    def __init__(self, path: str = GEO_DATA_PATH, cell: float = GEO_GRID_CELL,
+                 cache_size: int = GEO_CACHE_SIZE):
+        self.path = path
+        self.cell = cell
+        self.cache_size = cache_size
+        self._arrays = None
+        self._grid = None
+        self._cache = {}
+        self._missing = False
+
+    def _load(self) -> Optional[Dict[str, np.ndarray]]:
+        if self._arrays is None and not self._missing:
+            try:
+                self._arrays = {
+                    name: np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+                    for name in ARRAY_FILES
+                }
+                print(f"Geo data loaded: {len(self._arrays['zip_codes'])} ZIP codes, "
+                      f"{len(self._arrays['place_keys'])} places")
+            except (OSError, ValueError) as e:
+                print(f"Geo data unavailable, radius not enforced: {e}")
+                self._missing = True
+        return self._arrays
+
+    @property
+    def available(self) -> bool:
+        return self._load() is not None
+
+    @property
+    def grid(self) -> ZipGrid:
+        if self._grid is None:
+            self._grid = ZipGrid(np.asarray(self._load()['zip_coords']), self.cell)
+        return self._grid
+
+    def _lookup(self, keys: np.ndarray, values: np.ndarray, wanted: List) -> List[Optional[Tuple[float, float]]]:
+        """Coordinates for each wanted key in a sorted key array (None if missing)"""
+        if not wanted:
+            return []
+        if not len(keys):
+            return [None] * len(wanted)
+        wanted = np.asarray(wanted)
+        positions = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+        hits = keys[positions] == wanted
+        coords = values[positions]
+        return [
+            (float(lat), float(lon)) if hit else None
+            for hit, (lat, lon) in zip(hits, coords)
+        ]
+
+    def locate(self, locations: List[str]) -> np.ndarray:
+        """(n, 2) lat/lon array for location strings (a ZIP code, or 'City, ST'); NaN where unknown"""
+        points = np.full((len(locations), 2), np.nan)
+        arrays = self._load()
+        if arrays is None or not locations:
+            return points
+
+        # Resolve the strings this process hasn't seen yet, one searchsorted per table
+        found, zips, places = {}, {}, {}
+        for location in set(locations):
+            if location in self._cache:
+                found[location] = self._cache[location]
+                continue
+            match = ZIP_PATTERN.search(location or '')
+            if match:
+                zips[location] = int(match.group(1))
+            else:
+                places[location] = place_key(location).encode()
+
+        resolved = {}
+        for pending, keys, coords in (
+            (zips, arrays['zip_codes'], arrays['zip_coords']),
+            (places, arrays['place_keys'], arrays['place_coords'])
+        ):
+            resolved.update(zip(pending, self._lookup(keys, coords, list(pending.values()))))
+
+        # Evict between batches, never while one is being filled in
+        if len(self._cache) + len(resolved) > self.cache_size:
+            self._cache.clear()
+        self._cache.update(resolved)
+        found.update(resolved)
+
+        for idx, location in enumerate(locations):
+            point = found.get(location)
+            if point is not None:
+                points[idx] = point
+        return points
+
+    def point(self, location: str) -> Optional[Tuple[float, float]]:
+        lat, lon = self.locate([location])[0]
+        return None if math.isnan(lat) else (float(lat), float(lon))
+
+    def origin(self, params) -> Optional[Tuple[float, float]]:
+        """Where a search is centred: its ZIP code, else its location's place"""
+        if params.zipCode:
+            point = self.point(params.zipCode)
+            if point is not None:
+                return point
+        return self.point(params.location) if params.location else None
+
+    def nearest_zips(self, lat: float, lon: float, n: int = 1) -> List[Tuple[str, float]]:
+        """The n ZIP codes with centroids nearest to (lat, lon), with their distance in miles"""
+        if self._load() is None:
+            return []
+        indexes, miles = self.grid.nearest(lat, lon, n)
+        codes = self._arrays['zip_codes']
+        return [(f"{int(codes[idx]):05d}", float(distance)) for idx, distance in zip(indexes, miles)]
+
+    def search_zip(self, params) -> Optional[str]:
+        """The search's ZIP code, or the one nearest its location when it has none"""
+        if params.zipCode:
+            return params.zipCode
+        point = self.point(params.location) if params.location else None
+        if point is None:
+            return None
+        nearest = self.nearest_zips(point[0], point[1], 1)
+        return nearest[0][0] if nearest else None
+
+    def distances(self, origin: Tuple[float, float], vehicles: List[Vehicle]) -> np.ndarray:
+        """Miles from origin to each vehicle's location (NaN where unknown)"""
+        points = self.locate([vehicle.location for vehicle in vehicles])
+        return haversine_miles(origin[0], origin[1], points[:, 0], points[:, 1])
+
+    def within_radius(self, vehicles: List[Vehicle], origin: Optional[Tuple[float, float]],
+                      radius: Optional[float], keep_unlocated: bool = GEO_KEEP_UNLOCATED) -> List[Vehicle]:
+        """
+        Set each vehicle's distance from origin and return those within radius
+        miles, nearest first. Listings that can't be placed follow, if kept.
+        """
+        if origin is None or not vehicles:
+            return vehicles
+
+        miles = self.distances(origin, vehicles)
+        located = ~np.isnan(miles)
+        keep = located & (miles <= radius) if radius else located
+        order = np.flatnonzero(keep)[np.argsort(miles[keep], kind='stable')]
+
+        result = []
+        for idx in order:
+            vehicle = vehicles[idx]
+            vehicle.distance = round(float(miles[idx]), 1)
+            result.append(vehicle)
+
+        if keep_unlocated:
+            for idx in np.flatnonzero(~located):
+                vehicle = vehicles[idx]
+                vehicle.distance = None
+                result.append(vehicle)
+        return result
+
+    def stats(self) -> Dict:
+        arrays = self._load()
+        return {
+            'zipCodes': len(arrays['zip_codes']) if arrays else 0,
+            'places': len(arrays['place_keys']) if arrays else 0,
+            'cachedLocations': len(self._cache)
+        }
+
+
+geo_index = GeoIndex()
+
+def write_arrays(path: str, zips: Dict[int, Tuple[float, float]], places: Dict[str, Tuple[float, float]]):
+    """Write centroid tables in the layout GeoIndex memory-maps (sorted keys + float32 coords)"""
+    os.makedirs(path, exist_ok=True)
+    zip_codes = np.array(sorted(zips), dtype=np.uint32)
+    # Keys are ASCII words, stored as bytes: a quarter of the size of numpy unicode
+    place_keys = np.array(sorted(places), dtype=f"S{max((len(key) for key in places), default=1)}")
+    arrays = {
+        'zip_codes': zip_codes,
+        'zip_coords': np.array([zips[code] for code in zip_codes.tolist()], dtype=np.float32).reshape(-1, 2),
+        'place_keys': place_keys,
+        'place_coords': np.array([places[key.decode()] for key in place_keys.tolist()], dtype=np.float32).reshape(-1, 2),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+
+def read_gazetteer(path: str) -> List[Dict[str, str]]:
+    """Rows of a Census Gazetteer file (tab separated, padded header names)"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = [name.strip() for name in next(reader)]
+        return [dict(zip(header, (value.strip() for value in row))) for row in reader]
+
+def download_gazetteer(kind: str, directory: str) -> str:
+    """Fetch a Gazetteer archive ('zcta' or 'place') and return the path of its extracted text file"""
+    url = GAZETTEER_URL.format(kind=kind)
+    print(f"Downloading {url}")
+    archive = os.path.join(directory, f"{kind}.zip")
+    with httpx.stream('GET', url, follow_redirects=True, timeout=120) as response:
+        response.raise_for_status()
+        with open(archive, 'wb') as f:
+            for chunk in response.iter_bytes():
+                f.write(chunk)
+
+    with zipfile.ZipFile(archive) as zf:
+        name = next(name for name in zf.namelist() if name.endswith('.txt'))
+        return zf.extract(name, directory)
+
+def build(zcta_path: str, places_path: str, out: str):
+    """Build the centroid arrays in out from Gazetteer ZCTA and places files"""
+    zips = {
+        int(row['GEOID']): (float(row['INTPTLAT']), float(row['INTPTLONG']))
+        for row in read_gazetteer(zcta_path)
+    }
+
+    # Where a state has two places with the same name, keep the larger one
+    places, areas = {}, {}
+    for row in read_gazetteer(places_path):
+        key = place_key(f"{PLACE_SUFFIX.sub('', row['NAME'])} {row['USPS']}")
+        area = float(row.get('ALAND') or 0)
+        if key and area >= areas.get(key, -1):
+            places[key] = (float(row['INTPTLAT']), float(row['INTPTLONG']))
+            areas[key] = area
+
+    write_arrays(out, zips, places)
+    print(f"Wrote {len(zips)} ZIP codes and {len(places)} places to {out}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the offline ZIP/place centroid table from Census Gazetteer files')
+    parser.add_argument('--zcta', help='ZCTA Gazetteer file (e.g. 2023_Gaz_zcta_national.txt)')
+    parser.add_argument('--places', help='Places Gazetteer file (e.g. 2023_Gaz_place_national.txt)')
+    parser.add_argument('--download', action='store_true', help='fetch the 2023 Gazetteer files from census.gov')
+    parser.add_argument('--out', default=GEO_DATA_PATH)
+    args = parser.parse_args()
+
+    if args.download:
+        with tempfile.TemporaryDirectory() as tmp:
+            build(download_gazetteer('zcta', tmp), download_gazetteer('place', tmp), args.out)
+    elif args.zcta and args.places:
+        build(args.zcta, args.places, args.out)
+    else:
+        parser.error('pass --download, or both --zcta and --places')
+
+if __name__ == '__main__':
+    main()
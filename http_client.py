@@ -0,0 +1,67 @@
+"""
+Shared async HTTP transport for scrapers and API clients.
+One pooled httpx.AsyncClient per process with keep-alive, HTTP/2 where the
+server negotiates it, and a cap on concurrent connections per host.
+"""
+
+import asyncio
+import importlib.util
+import os
+from typing import Optional
+from urllib.parse import urlparse
+import httpx
+from sites_config import DEFAULT_TIMEOUT
+
+# Total pooled connections across all hosts
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+
+# Concurrent in-flight requests to a single host
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', '4'))
+
+# HTTP/2 needs the optional h2 package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+_client: Optional[httpx.AsyncClient] = None
+_host_slots = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide client, creating it on first use"""
+    global _client
+
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=30.0
+            ),
+            timeout=DEFAULT_TIMEOUT,
+            follow_redirects=True
+        )
+
+    return _client
+
+async def close_http_client():
+    """Close pooled connections (called on app shutdown)"""
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def fetch(url: str, method: str = 'GET', timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client.
+    Waits for a free per-host slot so one slow host can't take the whole pool.
+    """
+    host = urlparse(url).netloc
+    slots = _host_slots.setdefault(host, asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST))
+
+    async with slots:
+        return await get_http_client().request(
+            method,
+            url,
+            timeout=timeout or DEFAULT_TIMEOUT,
+            **kwargs
+        )
@@ -0,0 +1,200 @@
+"""
+Persistent local index of every listing the scrapers have streamed.
+Listings are upserted into SQLite (FTS5 full-text index on title and
+location) keyed by their stable id, so 'instant' searches can answer from
+what was already seen while fresh results are still being scraped.
+Listings not seen again within the max age are expired.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+from utils import YEAR_PATTERN
+from vehicle import Vehicle
+
+LISTING_INDEX_PATH = os.getenv('LISTING_INDEX_PATH', '.cache/listings.db')
+
+# Listings not seen by any search for this long are dropped (seconds)
+LISTING_INDEX_MAX_AGE = int(os.getenv('LISTING_INDEX_MAX_AGE', str(3 * 24 * 3600)))
+
+# Most listings an instant search returns from the index
+LISTING_INDEX_MAX_RESULTS = int(os.getenv('LISTING_INDEX_MAX_RESULTS', '50'))
+
+# How often expired listings are purged (seconds)
+EXPIRE_INTERVAL = 3600
+
+# Runs of letters and digits, like FTS5's unicode61 tokenizer ('4Runner', 'F-150' -> 'f', '150')
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    title TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    year INTEGER,
+    location TEXT,
+    area TEXT,
+    url TEXT,
+    data TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS listings_area_price ON listings (area, price);
+CREATE INDEX IF NOT EXISTS listings_last_seen ON listings (last_seen);
+"""
+
+# External-content FTS table kept in sync with listings by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5(
+    title, location, content='listings', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS listings_ai AFTER INSERT ON listings BEGIN
+    INSERT INTO listings_fts (rowid, title, location) VALUES (new.rowid, new.title, new.location);
+END;
+CREATE TRIGGER IF NOT EXISTS listings_ad AFTER DELETE ON listings BEGIN
+    INSERT INTO listings_fts (listings_fts, rowid, title, location) VALUES ('delete', old.rowid, old.title, old.location);
+END;
+CREATE TRIGGER IF NOT EXISTS listings_au AFTER UPDATE OF title, location ON listings BEGIN
+    INSERT INTO listings_fts (listings_fts, rowid, title, location) VALUES ('delete', old.rowid, old.title, old.location);
+    INSERT INTO listings_fts (rowid, title, location) VALUES (new.rowid, new.title, new.location);
+END;
+"""
+
+UPSERT = """
+INSERT INTO listings (id, source, title, price, year, location, area, url, data, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    title = excluded.title, price = excluded.price, year = excluded.year,
+    location = excluded.location, area = excluded.area, url = excluded.url,
+    data = excluded.data, last_seen = excluded.last_seen
+"""
+
+def normalize_area(location: Optional[str]) -> str:
+    """Canonical form of a search location ('Los Angeles, CA' -> 'los angeles ca')"""
+    return ' '.join(TOKEN_PATTERN.findall((location or '').lower()))
+
+def listing_year(title: str) -> Optional[int]:
+    match = YEAR_PATTERN.search(title or '')
+    return int(match.group(1)) if match else None
+
+class ListingIndex:
+    """SQLite listing store shared by every search in this process"""
+
+    def __init__(self, path: str = LISTING_INDEX_PATH, max_age: int = LISTING_INDEX_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.fts = False
+        self._conn = None
+        self._lock = threading.Lock()  # Writes run in worker threads
+        self._expired_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError as e:
+                print(f"SQLite FTS5 unavailable, instant search falls back to LIKE: {e}")
+            self._conn = conn
+        return self._conn
+
+    def add(self, vehicles: List[Vehicle], location: Optional[str] = None):
+        """Upsert listings found for a search in location, refreshing their last-seen time"""
+        now = time.time()
+        area = normalize_area(location)
+        rows = [
+            (
+                vehicle.id or vehicle.url,
+                vehicle.source,
+                vehicle.title or '',
+                vehicle.price or 0,
+                listing_year(vehicle.title),
+                vehicle.location,
+                area,
+                vehicle.url,
+                json.dumps(dict(vehicle.to_dict(), distance=None)),  # Distance depends on the search
+                now,
+                now
+            )
+            for vehicle in vehicles
+            if vehicle.id or vehicle.url
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(UPSERT, rows)
+            if now - self._expired_at >= EXPIRE_INTERVAL:
+                self._expire(now)
+
+    def _expire(self, now: float):
+        with self._connect() as conn:
+            removed = conn.execute('DELETE FROM listings WHERE last_seen < ?', (now - self.max_age,)).rowcount
+        self._expired_at = now
+        if removed:
+            print(f"Expired {removed} listings from the index")
+
+    def expire(self):
+        """Drop listings not seen within max_age"""
+        with self._lock:
+            self._expire(time.time())
+
+    def search(self, params, limit: int = LISTING_INDEX_MAX_RESULTS) -> List[Vehicle]:
+        """
+        Recently seen listings matching the search keyword, location, price
+        and year range, newest first. The caller applies the remaining filters.
+        """
+        words = TOKEN_PATTERN.findall((params.keyword or '').lower())
+        clauses = ['l.area = ?', 'l.price <= ?', 'l.last_seen >= ?']
+        args = [normalize_area(params.location), params.maxPrice, time.time() - self.max_age]
+
+        if params.minYear:
+            clauses.append('(l.year IS NULL OR l.year >= ?)')
+            args.append(params.minYear)
+        if params.maxYear:
+            clauses.append('(l.year IS NULL OR l.year <= ?)')
+            args.append(params.maxYear)
+
+        with self._lock:
+            conn = self._connect()
+
+            if words and self.fts:
+                # Every keyword must appear in the title, as a word prefix
+                match = ' AND '.join(f'title:"{word}"*' for word in words)
+                sql = ('SELECT l.data FROM listings_fts f JOIN listings l ON l.rowid = f.rowid '
+                       f'WHERE listings_fts MATCH ? AND {" AND ".join(clauses)} '
+                       'ORDER BY l.last_seen DESC LIMIT ?')
+                args = [match] + args
+            else:
+                for word in words:
+                    clauses.append('l.title LIKE ?')
+                    args.append(f'%{word}%')
+                sql = (f'SELECT l.data FROM listings l WHERE {" AND ".join(clauses)} '
+                       'ORDER BY l.last_seen DESC LIMIT ?')
+
+            rows = conn.execute(sql, args + [limit]).fetchall()
+
+        return [Vehicle.from_dict(json.loads(data)) for (data,) in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+listing_index = ListingIndex()
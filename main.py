@@ -1,13 +1,92 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from contextlib import asynccontextmanager
 import asyncio
-import json
-from scrapers import search_all_sites
+from sse import encode_event, stream_events
+from search_cache import search_cache
+from browser_pool import browser_pool
+from http_client import close_http_client
+from rate_limiter import rate_limiter
+from site_health import site_health
+from listing_index import listing_index
+from geo import geo_index, GEO_REQUIRED
+from prefetch import prefetcher
+from parse_pool import parse_pool
+from shared_store import shared_store
+from metrics import metrics
+from tracing import Trace, trace_allowed
+from sites_config import FULL_SITES
 
-app = FastAPI(title="CarFinder Pro API", version="2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Map the ZIP table now rather than on the first search
+    if not geo_index.available:
+        if GEO_REQUIRED:
+            raise RuntimeError(f"Geo data missing from {geo_index.path}: run `python geo.py --download`")
+        print(f"WARNING: no geo data in {geo_index.path}, radius is only passed to the sites "
+              f"(run `python geo.py --download` to build it)")
+    # Warm up a shared browser so the first Playwright site doesn't pay for the launch
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        print(f"Browser pool failed to start, will retry on first use: {e}")
+    try:
+        await asyncio.to_thread(listing_index.expire)
+    except Exception as e:
+        print(f"Listing index unavailable: {e}")
+    await parse_pool.start()
+    site_health.start()
+    prefetcher.start()
+    metrics.start()
+    yield
+    await metrics.stop()
+    await prefetcher.stop()
+    await site_health.stop()
+    await parse_pool.stop()
+    await browser_pool.stop()
+    await close_http_client()
+    listing_index.close()
+    if shared_store is not None:
+        shared_store.close()
+
+app = FastAPI(title="CarFinder Pro API", version="2.0", lifespan=lifespan)
+
+metrics.gauge('active_searches', 'Searches running for clients (prefetches excluded)',
+              lambda: search_cache.live_searches)
+metrics.gauge('browser_open_pages', 'Playwright pages currently open', lambda: browser_pool.open_pages)
+metrics.gauge('search_cache_entries', 'Search results cached in this worker',
+              lambda: search_cache.stats()['entries'])
+metrics.gauge('search_cache_in_flight', 'Searches running that identical searches can join',
+              lambda: search_cache.stats()['in_flight'])
+metrics.gauge('search_cache_lookups_total', 'Search cache lookups by result',
+              lambda: {(result,): count for result, count in search_cache.stats().items()
+                       if result in ('hits', 'misses', 'coalesced', 'followed')},
+              ('result',), 'counter')
+metrics.gauge('rate_limit_waiting', "Requests queued on each host's rate limit",
+              lambda: {(host,): stats['waiting'] for host, stats in rate_limiter.stats().items()}, ('host',))
+metrics.gauge('rate_limit_tokens', "Requests each host's rate limit allows right now",
+              lambda: {(host,): stats['tokens'] for host, stats in rate_limiter.stats().items()}, ('host',))
+metrics.gauge('prefetch_tracked_queries', 'Search queries the prefetcher is counting',
+              lambda: prefetcher.stats()['tracked'])
+metrics.gauge('prefetches_total', 'Background prefetch searches by result',
+              lambda: {(result,): count for result, count in prefetcher.stats().items()
+                       if result in ('prefetched', 'failed')},
+              ('result',), 'counter')
+metrics.gauge('parse_pool_workers', 'Processes in the parse pool (0 when parsing in the event loop)',
+              lambda: parse_pool.stats()['workers'])
+metrics.gauge('pages_parsed_total', 'Pages parsed, by where they were parsed',
+              lambda: {(where,): count for where, count in parse_pool.stats().items()
+                       if where in ('offloaded', 'in_loop')},
+              ('where',), 'counter')
+metrics.gauge('geo_table_entries', 'ZIP codes and places in the geo table',
+              lambda: {(table,): count for table, count in geo_index.stats().items()
+                       if table in ('zipCodes', 'places')},
+              ('table',))
+metrics.gauge('geo_cached_locations', 'Listing locations resolved and cached in this worker',
+              lambda: geo_index.stats()['cachedLocations'])
 
 # CORS - Allow your Lovable frontend
 app.add_middleware(
@@ -33,7 +112,9 @@ class SearchParams(BaseModel):
     condition: Optional[str] = None
     fuelTypes: Optional[List[str]] = None
     privateOnly: Optional[bool] = False
-    searchMode: Optional[str] = 'fast'
+    searchMode: Optional[str] = 'fast'  # 'fast', 'full' or 'instant'
+    deadlineMs: Optional[int] = None  # Stop and return what's been found after this long
+    targetResults: Optional[int] = None  # Stop once this many unique listings have been sent
 
 @app.get("/")
 async def root():
@@ -41,38 +122,71 @@ async def root():
         "status": "ok",
         "message": "CarFinder Pro API",
         "version": "2.0",
-        "endpoints": ["/api/search"]
+        "endpoints": ["/api/search", "/api/sites/health", "/metrics"]
     }
 
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
 
+@app.get("/api/sites/health")
+async def sites_health():
+    """Circuit breaker state, latency and current timeout for every site"""
+    return site_health.status(FULL_SITES)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: per-site stage timings, listing and error counters, gauges"""
+    return PlainTextResponse(await metrics.exposition(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/search")
-async def search_vehicles(params: SearchParams):
+async def search_vehicles(params: SearchParams, events: str = 'batch', trace: Optional[str] = None,
+                          x_trace: Optional[str] = Header(None), x_trace_token: Optional[str] = Header(None)):
     """
     Stream vehicle search results using Server-Sent Events (SSE).
+    Results are batched into 'results' events; pass ?events=single for one
+    'result' event per vehicle instead.
+    Pass ?trace=1 (or an X-Trace: 1 header) to end the stream with a
+    'trace' event timing every site; trace=profile adds a sampled CPU
+    profile. Only honoured when SEARCH_TRACING=1 (plus X-Trace-Token if
+    SEARCH_TRACE_TOKEN is set). Traced searches skip cached results but
+    still join an identical search that is already running.
     
     Event types:
     - progress: {type: 'progress', current: int, total: int, site: str}
-    - result: {type: 'result', vehicle: {...}}
-    - complete: {type: 'complete'}
+    - results: {type: 'results', vehicles: [{...}], indexed?: true}
+    - result: {type: 'result', vehicle: {...}, indexed?: true}  (events=single)
+    - complete: {type: 'complete', reason: 'finished' | 'deadline' | 'target',
+                 results: int, elapsedMs: int, skipped: [site], cutOff: [site]}
     - error: {type: 'error', message: str}
+    - trace: {type: 'trace', elapsedMs: float, sites: [{site, queuedMs, startMs, endMs, pages,
+              bytes, containers, passed, sent, duplicates, error, stagesMs}], profile?: {...}}
     """
+    trace_mode = (trace or x_trace or '').lower()
+    search_trace = None
+    if trace_mode in ('1', 'true', 'profile') and trace_allowed(x_trace_token):
+        search_trace = Trace(profile=trace_mode == 'profile')
+    
     async def event_generator():
         try:
             total_sites = 35 if params.searchMode == 'full' else 10
+            prefetcher.record(params, total_sites)
             
-            async for event in search_all_sites(params, total_sites):
-                if event['type'] in ['progress', 'result']:
-                    yield f"data: {json.dumps(event)}\n\n"
-                await asyncio.sleep(0.05)  # Small delay for smooth streaming
-            
-            yield f"data: {json.dumps({'type': 'complete'})}\n\n"
+            if search_trace is not None:
+                search_trace.start()
+            search = search_cache.search(params, total_sites, fresh=search_trace is not None)
+            async for frame in stream_events(search, batch=events != 'single'):
+                yield frame
             
         except Exception as e:
             print(f"Search error: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            yield encode_event({'type': 'error', 'message': str(e)})
+        finally:
+            if search_trace is not None:
+                search_trace.stop()
+        
+        if search_trace is not None:
+            yield encode_event(search_trace.event())
     
     return StreamingResponse(
         event_generator(),
@@ -0,0 +1,268 @@
+"""
+Process metrics in the Prometheus text format, served at /metrics.
+Per-site timings for every search stage (queue wait, fetch, Playwright
+render, parse, filter, dedup) go into one histogram labelled by site and
+stage, next to counters for containers, passing listings, duplicates and
+errors, and gauges read when metrics are scraped. Recording is a dict
+lookup and a few additions on the event loop, cheap enough to leave on.
+Stage timings are also added to the search's trace, when it has one.
+With several workers each one publishes its samples to the shared store
+and /metrics sums the counters and histograms; gauges are reported per
+worker, with a worker label.
+"""
+
+import asyncio
+import bisect
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from shared_store import shared_store
+from tracing import current_trace
+
+# Prefix for every metric name
+METRICS_PREFIX = os.getenv('METRICS_PREFIX', 'carfinder')
+
+# Seconds between publishing this worker's samples to the shared store (multiple workers only)
+METRICS_PUBLISH_INTERVAL = int(os.getenv('METRICS_PUBLISH_INTERVAL', '15'))
+
+# Histogram buckets for stage timings (seconds)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Tuple, values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    """Monotonic count per label combination"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.samples = {}
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        self.samples[labels] = self.samples.get(labels, 0) + amount
+
+    def snapshot(self) -> List:
+        return [[list(labels), value] for labels, value in self.samples.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return value if total is None else total + value
+
+    def lines(self, labels: Tuple, value, extra: str = '') -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, labels, extra)} {_format_value(value)}"]
+
+class Gauge(Counter):
+    """
+    Current value read from a callback when metrics are collected. With
+    labels the callback returns {label values tuple: value}. Totals kept
+    elsewhere (e.g. cache hits) are read the same way, as kind 'counter'.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable, labels: Tuple = (), kind: str = 'gauge'):
+        super().__init__(name, help, labels)
+        self.read = read
+        self.kind = kind
+
+    def snapshot(self) -> List:
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Metric {self.name} failed: {e}")
+            return []
+        if not self.labels:
+            return [[[], value]]
+        return [[list(labels), sample] for labels, sample in value.items()]
+
+class Histogram(Counter):
+    """
+    Bucketed observations per label combination. Each sample is a list of
+    per-bucket counts (the last one is +Inf) followed by the sum and count.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Tuple = (), buckets: Tuple = STAGE_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, labels: Tuple, value: float):
+        sample = self.samples.get(labels)
+        if sample is None:
+            sample = self.samples[labels] = [0] * (len(self.buckets) + 3)
+        sample[bisect.bisect_left(self.buckets, value)] += 1
+        sample[-2] += value
+        sample[-1] += 1
+
+    def snapshot(self) -> List:
+        return [[list(labels), list(sample)] for labels, sample in self.samples.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return list(value) if total is None else [a + b for a, b in zip(total, value)]
+
+    def lines(self, labels: Tuple, sample) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), sample):
+            cumulative += count
+            le = _format_labels(self.labels, labels, f'le="{bound}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        label_text = _format_labels(self.labels, labels)
+        lines.append(f"{self.name}_sum{label_text} {_format_value(sample[-2])}")
+        lines.append(f"{self.name}_count{label_text} {sample[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """Named metrics for this process, plus other workers' published samples"""
+
+    def __init__(self, prefix: str = METRICS_PREFIX, store=None, interval: int = METRICS_PUBLISH_INTERVAL):
+        self.prefix = prefix
+        self.store = store
+        self.interval = interval
+        self.metrics = {}
+        self._task = None
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple = ()) -> Counter:
+        return self._register(Counter(f"{self.prefix}_{name}", help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple = (), buckets: Tuple = STAGE_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{self.prefix}_{name}", help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable, labels: Tuple = (), kind: str = 'gauge') -> Gauge:
+        return self._register(Gauge(f"{self.prefix}_{name}", help, read, labels, kind))
+
+    def snapshot(self) -> Dict:
+        """This process's samples as plain JSON-able lists"""
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def published(self) -> List[Tuple[str, Dict]]:
+        """(worker, snapshot) the other workers last published (blocking, run off the loop)"""
+        if self.store is None:
+            return []
+        return [
+            (owner, json.loads(value)) for owner, value in self.store.items('metrics')
+            if owner != self.store.owner
+        ]
+
+    def render(self, others: Optional[List[Tuple[str, Dict]]] = None) -> str:
+        """
+        Prometheus text exposition of this process's samples and others'.
+        Counters and histograms are summed; with a shared store, gauges get
+        a worker label instead, since adding them up (a cache size, a shared
+        bucket's tokens) would report N times the real value.
+        """
+        owner = self.store.owner if self.store is not None else ''
+        snapshots = [(owner, self.snapshot())] + (others or [])
+        lines = []
+
+        for name, metric in self.metrics.items():
+            per_worker = self.store is not None and metric.kind == 'gauge'
+            merged = {}
+            for worker, snapshot in snapshots:
+                for labels, value in snapshot.get(name, ()):
+                    if per_worker:
+                        merged[(worker, tuple(labels))] = value
+                    else:
+                        key = tuple(labels)
+                        merged[key] = metric.merge(merged.get(key), value)
+
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key in sorted(merged):
+                if per_worker:
+                    worker, labels = key
+                    lines.extend(metric.lines(labels, merged[key], f'worker="{_escape(worker)}"'))
+                else:
+                    lines.extend(metric.lines(key, merged[key]))
+
+        return '\n'.join(lines) + '\n'
+
+    async def exposition(self) -> str:
+        """render() including the other workers' samples, when there is a shared store"""
+        others = []
+        if self.store is not None:
+            try:
+                others = await asyncio.to_thread(self.published)
+            except Exception as e:
+                print(f"Reading published metrics failed: {e}")
+        return self.render(others)
+
+    async def _publish(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                data = json.dumps(self.snapshot()).encode()
+                # Expires if this worker dies, so its samples drop out of the totals
+                await asyncio.to_thread(self.store.put, 'metrics', self.store.owner, data, self.interval * 3)
+            except Exception as e:
+                print(f"Publishing metrics failed: {e}")
+
+    def start(self):
+        if self.store is not None and self._task is None:
+            self._task = asyncio.create_task(self._publish())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+metrics = MetricsRegistry(store=shared_store)
+
+stage_seconds = metrics.histogram(
+    'stage_seconds', 'Time spent per site in each search stage', ('site', 'stage')
+)
+containers_found = metrics.counter(
+    'containers_found_total', 'Listing containers found on fetched pages', ('site',)
+)
+listings_passed = metrics.counter(
+    'listings_passed_total', 'Listings that passed the search filters', ('site',)
+)
+duplicates_dropped = metrics.counter(
+    'duplicates_dropped_total', 'Listings dropped as duplicates of ones already sent', ('site',)
+)
+errors = metrics.counter(
+    'errors_total', 'Site failures by exception type', ('site', 'type')
+)
+
+def observe_stage(site: str, stage: str, seconds: float):
+    stage_seconds.observe((site, stage), seconds)
+    trace = current_trace()
+    if trace is not None:
+        trace.stage(site, stage, seconds)
+
+@contextmanager
+def time_stage(site: str, stage: str):
+    """Time the block as one observation of a site's stage (failures included, cancellations not)"""
+    start = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        # Abandoned (target met, search over), so its duration says nothing about the site
+        raise
+    except BaseException:
+        observe_stage(site, stage, time.perf_counter() - start)
+        raise
+    observe_stage(site, stage, time.perf_counter() - start)
+
+def count_error(site: str, error: BaseException):
+    errors.inc((site, type(error).__name__))
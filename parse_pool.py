@@ -0,0 +1,140 @@
+"""
+Process pool for parsing and extracting fetched pages off the event loop.
+Workers are started and warmed at app startup with every site's compiled
+extractor already loaded, receive a page plus the search filters, and send
+back only the extracted Vehicles. Small pages are still parsed in-loop,
+where handing them to a worker would cost more than it saves. The CPU
+each page costs, wherever it was parsed, is charged to the CpuAccount of
+the search's context, if it has one (the prefetcher budgets with it).
+"""
+
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+from extractors import EXTRACTORS, ExtractStats, get_extractor
+from shared_store import WEB_CONCURRENCY
+from utils import compile_filters
+from vehicle import Vehicle
+
+# Worker processes per app worker (0 = parse everything in-loop); the CPUs are split between app workers
+PARSE_POOL_WORKERS = int(os.getenv(
+    'PARSE_POOL_WORKERS',
+    str(max(1, min(4, os.cpu_count() or 1) // WEB_CONCURRENCY))
+))
+
+# Pages smaller than this are parsed in-loop (bytes)
+PARSE_POOL_MIN_BYTES = int(os.getenv('PARSE_POOL_MIN_BYTES', '50000'))
+
+_cpu_account = contextvars.ContextVar('parse_cpu_account', default=None)
+
+class CpuAccount:
+    """CPU seconds spent parsing pages for the searches of one context"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+def cpu_account() -> CpuAccount:
+    """Charge parse CPU of this context, and of tasks it creates from now on, to a new account"""
+    account = CpuAccount()
+    _cpu_account.set(account)
+    return account
+
+def _charge(seconds: float):
+    account = _cpu_account.get()
+    if account is not None:
+        account.seconds += seconds
+
+def _warm_worker() -> int:
+    """Runs once per worker at startup; importing extractors compiles every site"""
+    return len(EXTRACTORS)
+
+def _extract_in_worker(site, page: str, limit: int, params: Dict) -> Tuple[List[Vehicle], ExtractStats, float]:
+    cpu_started = time.thread_time()
+    # Configured sites are sent by name, their extractors are already compiled here
+    extractor = get_extractor(site if isinstance(site, dict) else {'name': site})
+    stats = ExtractStats()
+    vehicles = extractor.extract(page, limit, compile_filters(SimpleNamespace(**params)), stats)
+    return vehicles, stats, time.thread_time() - cpu_started
+
+class ParsePool:
+    """Warm worker processes for parse + extract"""
+
+    def __init__(self, workers: int = PARSE_POOL_WORKERS, min_bytes: int = PARSE_POOL_MIN_BYTES):
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self._executor = None
+        self.offloaded = 0
+        self.in_loop = 0
+
+    async def start(self):
+        """Start the workers and wait until each has loaded the site extractors"""
+        if self.workers <= 0 or self._executor is not None:
+            return
+
+        # spawn: forking a process with a running event loop and threads isn't safe
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_worker) for _ in range(self.workers)))
+        print(f"Parse pool ready with {self.workers} workers")
+
+    async def stop(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+
+    async def extract(self, site: Dict, page: str, limit: int, params, filters=None,
+                      stats: Optional[ExtractStats] = None) -> List[Vehicle]:
+        """
+        Extract up to limit vehicles passing the search filters from a page,
+        in a worker for large pages once the pool is running, in-loop otherwise.
+        Container counts and filter time are added to stats, if given.
+        """
+        if self._executor is None or not page or len(page) < self.min_bytes:
+            return self._extract_in_loop(site, page, limit, params, filters, stats)
+
+        executor = self._executor
+        spec = site['name'] if site['name'] in EXTRACTORS else site
+        loop = asyncio.get_running_loop()
+        try:
+            vehicles, worker_stats, cpu_seconds = await loop.run_in_executor(
+                executor, _extract_in_worker, spec, page, limit, params.model_dump()
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory) - restart the pool and parse this page here
+            if self._executor is executor:
+                print("Parse pool broken, restarting")
+                self._executor = None
+                executor.shutdown(wait=False)
+                asyncio.create_task(self.start())
+            return self._extract_in_loop(site, page, limit, params, filters, stats)
+
+        if stats is not None:
+            stats.add(worker_stats)
+        _charge(cpu_seconds)
+        self.offloaded += 1
+        return vehicles
+
+    def _extract_in_loop(self, site: Dict, page: str, limit: int, params, filters=None,
+                         stats: Optional[ExtractStats] = None) -> List[Vehicle]:
+        self.in_loop += 1
+        cpu_started = time.thread_time()
+        try:
+            return get_extractor(site).extract(page, limit, filters or compile_filters(params), stats)
+        finally:
+            _charge(time.thread_time() - cpu_started)
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.workers if self._executor is not None else 0,
+            'offloaded': self.offloaded,
+            'in_loop': self.in_loop
+        }
+
+
+parse_pool = ParsePool()
@@ -0,0 +1,181 @@
+"""
+Background prefetcher that keeps popular searches warm.
+Every /api/search is counted under its normalized cache key with a
+decaying popularity score. On a schedule the top queries whose cached
+results are missing or about to expire are re-scraped through the search
+cache - and so through the same per-host rate limiters - within a
+concurrency and CPU budget that yields to live searches, both before a
+prefetch starts and before each of its sites. With several
+workers only the one holding the prefetch lease runs cycles, ranking
+queries by its own share of the traffic.
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Tuple
+from parse_pool import cpu_account
+from search_cache import search_cache, cache_key
+from shared_store import shared_store
+
+# Queries kept warm per cycle (0 disables prefetching)
+PREFETCH_TOP_N = int(os.getenv('PREFETCH_TOP_N', '10'))
+
+# Seconds between prefetch cycles
+PREFETCH_INTERVAL = int(os.getenv('PREFETCH_INTERVAL', '120'))
+
+# Popularity halves after this many seconds without new requests
+PREFETCH_HALF_LIFE = int(os.getenv('PREFETCH_HALF_LIFE', '3600'))
+
+# Queries need at least this score to be prefetched (each request adds 1.0, then decays)
+PREFETCH_MIN_SCORE = float(os.getenv('PREFETCH_MIN_SCORE', '1.5'))
+
+# Prefetch searches running at once, and sites scraped at once within each
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', '1'))
+PREFETCH_SITE_CONCURRENCY = int(os.getenv('PREFETCH_SITE_CONCURRENCY', '2'))
+
+# Share of one CPU the prefetcher's page parsing may use; it idles after each search to stay under it
+PREFETCH_CPU_BUDGET = float(os.getenv('PREFETCH_CPU_BUDGET', '0.25'))
+
+# Prefetching pauses while more live searches than this are running
+PREFETCH_MAX_LIVE_SEARCHES = int(os.getenv('PREFETCH_MAX_LIVE_SEARCHES', '0'))
+
+# Most distinct queries tracked; the least popular are forgotten first
+PREFETCH_MAX_TRACKED = 1000
+
+class QueryStats:
+    """Decaying request count for one normalized query"""
+
+    def __init__(self, params, total_sites: int):
+        self.params = params
+        self.total_sites = total_sites
+        self.score = 0.0
+        self.updated_at = time.monotonic()
+        self.prefetches = 0
+
+    def current_score(self, now: float) -> float:
+        return self.score * 0.5 ** ((now - self.updated_at) / PREFETCH_HALF_LIFE)
+
+    def hit(self, now: float):
+        self.score = self.current_score(now) + 1
+        self.updated_at = now
+
+class Prefetcher:
+    """Tracks query popularity and re-scrapes the top queries on a schedule"""
+
+    def __init__(self, top_n: int = PREFETCH_TOP_N, interval: int = PREFETCH_INTERVAL):
+        self.top_n = top_n
+        self.interval = interval
+        self._queries = {}  # cache key -> QueryStats
+        self._task = None
+        self._slots = asyncio.Semaphore(max(1, PREFETCH_CONCURRENCY))
+        self.prefetched = 0
+        self.failed = 0
+
+    def record(self, params, total_sites: int):
+        """Count a client search"""
+        if not self.top_n:
+            return
+
+        now = time.monotonic()
+        key = cache_key(params, total_sites)
+        stats = self._queries.get(key)
+        if stats is None:
+            if len(self._queries) >= PREFETCH_MAX_TRACKED:
+                self._forget(now)
+            stats = self._queries[key] = QueryStats(params, total_sites)
+        stats.hit(now)
+
+    def _forget(self, now: float):
+        """Drop the least popular half of the tracked queries"""
+        ranked = sorted(self._queries, key=lambda key: self._queries[key].current_score(now))
+        for key in ranked[:len(ranked) // 2]:
+            del self._queries[key]
+
+    async def due(self) -> List[Tuple[str, QueryStats]]:
+        """Top queries whose cached results are missing or expire before the next cycle"""
+        now = time.monotonic()
+        ranked = sorted(
+            ((key, stats) for key, stats in self._queries.items() if stats.current_score(now) >= PREFETCH_MIN_SCORE),
+            key=lambda item: item[1].current_score(now),
+            reverse=True
+        )[:self.top_n]
+        return [(key, stats) for key, stats in ranked if await search_cache.expires_in(key) <= self.interval]
+
+    @staticmethod
+    async def _yield_to_live_searches():
+        while search_cache.live_searches > PREFETCH_MAX_LIVE_SEARCHES:
+            await asyncio.sleep(1)
+
+    async def _prefetch(self, key: str, stats: QueryStats):
+        async with self._slots:
+            # Live searches come first, here and again before each site
+            await self._yield_to_live_searches()
+
+            started = time.monotonic()
+            # This prefetch's own parse CPU, in the loop or the parse pool, not the worker's
+            cpu = cpu_account()
+            try:
+                ok = await search_cache.refresh(stats.params, stats.total_sites, PREFETCH_SITE_CONCURRENCY,
+                                                self._yield_to_live_searches)
+            except Exception as e:
+                print(f"Prefetch failed: {e}")
+                ok = False
+
+            if ok:
+                self.prefetched += 1
+                stats.prefetches += 1
+            else:
+                self.failed += 1
+
+            # Idle long enough that this search's CPU time stays within the budget
+            idle = cpu.seconds / PREFETCH_CPU_BUDGET - (time.monotonic() - started)
+            if idle > 0:
+                await asyncio.sleep(idle)
+
+    async def run_once(self):
+        """Prefetch every due query"""
+        due = await self.due()
+        if due:
+            print(f"Prefetching {len(due)} popular searches")
+            await asyncio.gather(*(self._prefetch(key, stats) for key, stats in due))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if shared_store is not None:
+                    # One prefetching worker; the lease outlives a cycle so the leader keeps it
+                    if not await asyncio.to_thread(shared_store.acquire_lease, 'prefetch', self.interval * 3):
+                        continue
+                    await asyncio.to_thread(shared_store.purge)
+                await self.run_once()
+            except Exception as e:
+                print(f"Prefetch cycle failed: {e}")
+
+    def start(self):
+        if self.top_n and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        top = sorted(self._queries.values(), key=lambda stats: stats.current_score(now), reverse=True)[:self.top_n]
+        return {
+            'tracked': len(self._queries),
+            'prefetched': self.prefetched,
+            'failed': self.failed,
+            'top': [
+                {'keyword': stats.params.keyword, 'location': stats.params.location,
+                 'score': round(stats.current_score(now), 2), 'prefetches': stats.prefetches}
+                for stats in top
+            ]
+        }
+
+
+prefetcher = Prefetcher()
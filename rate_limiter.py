@@ -0,0 +1,118 @@
+"""
+Process-wide per-host rate limiter.
+Every outbound scrape request waits on a token bucket for its host, so
+the politeness budget holds across all concurrent searches. Requests for
+a host queue in FIFO order; hosts with tokens to spare never wait. With
+several workers the buckets live in the shared store, so the budget holds
+across processes too.
+"""
+
+import asyncio
+import time
+from typing import Dict
+from urllib.parse import urlparse
+from sites_config import FULL_SITES, DEFAULT_RATE_LIMIT
+from shared_store import shared_store
+
+class TokenBucket:
+    """Refills at per_second tokens/second up to burst; one token per request"""
+
+    def __init__(self, per_second: float, burst: int):
+        self.per_second = per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()  # FIFO, so waiters are served in arrival order
+        self.waiting = 0
+
+    def reserve(self) -> float:
+        """Take a token, returning how long to wait until it is actually available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.per_second)
+        self.updated_at = now
+
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.per_second
+
+    async def take(self) -> float:
+        """reserve(), as awaited by the limiter"""
+        return self.reserve()
+
+    def available(self) -> float:
+        """Tokens available now, negative while requests wait on future ones"""
+        return min(self.burst, self.tokens + (time.monotonic() - self.updated_at) * self.per_second)
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose tokens are kept in the shared store, one per host across all workers"""
+
+    def __init__(self, host: str, per_second: float, burst: int, store):
+        super().__init__(per_second, burst)
+        self.host = host
+        self.store = store
+
+    def reserve(self) -> float:
+        wait = self.store.take_token(self.host, self.per_second, self.burst)
+        self.tokens = -wait * self.per_second if wait else 0.0  # Approximate, for stats
+        self.updated_at = time.monotonic()
+        return wait
+
+    async def take(self) -> float:
+        # BEGIN IMMEDIATE can wait on other workers, so never on the event loop
+        return await asyncio.to_thread(self.reserve)
+
+class HostRateLimiter:
+    """Token bucket per host, with per-host rates from sites_config"""
+
+    def __init__(self, default_limit: Dict = DEFAULT_RATE_LIMIT, store=None):
+        self.default_limit = default_limit
+        self.store = store
+        self._limits = {}
+        self._buckets = {}
+
+    @classmethod
+    def from_sites(cls, sites: list, store=None) -> 'HostRateLimiter':
+        limiter = cls(store=store)
+        for site in sites:
+            if site.get('rate_limit'):
+                limiter.configure(urlparse(site['base_url']).netloc, site['rate_limit'])
+        return limiter
+
+    def configure(self, host: str, limit: Dict):
+        self._limits[host] = limit
+        self._buckets.pop(host, None)
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            limit = self._limits.get(host, self.default_limit)
+            if self.store is not None:
+                bucket = SharedTokenBucket(host, limit['per_second'], limit['burst'], self.store)
+            else:
+                bucket = TokenBucket(limit['per_second'], limit['burst'])
+            self._buckets[host] = bucket
+        return bucket
+
+    async def acquire(self, host: str):
+        """Wait for this host's turn; returns immediately if the host has budget left"""
+        bucket = self._bucket(host)
+        bucket.waiting += 1
+
+        try:
+            # Uncontended lock acquisition doesn't yield, so hosts with tokens never wait
+            async with bucket.lock:
+                wait = await bucket.take()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+        finally:
+            bucket.waiting -= 1
+
+    def stats(self) -> Dict:
+        return {
+            host: {'tokens': round(bucket.available(), 2), 'waiting': bucket.waiting}
+            for host, bucket in self._buckets.items()
+        }
+
+
+rate_limiter = HostRateLimiter.from_sites(FULL_SITES, store=shared_store)
@@ -0,0 +1,195 @@
+"""
+Per-URL raw response cache on local disk.
+Stores the HTML/JSON behind each search URL with a short freshness window,
+revalidates with ETag/Last-Modified once stale, and evicts the least
+recently used entries when the cache grows past its size limit. Disk
+reads, writes and eviction run in worker threads, off the event loop.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+from http_client import fetch
+
+RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '.cache/responses')
+
+# Disk budget for cached responses (bytes)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# Serve without revalidating for this long after fetching (seconds)
+RESPONSE_CACHE_FRESH_SECONDS = int(os.getenv('RESPONSE_CACHE_FRESH_SECONDS', '60'))
+
+class CachedResponse:
+    """A cached body plus the validators needed to revalidate it"""
+
+    def __init__(self, meta: Dict, body: str):
+        self.meta = meta
+        self.body = body
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.meta.get('etag')
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.meta.get('last_modified')
+
+    def is_fresh(self, fresh_for: int) -> bool:
+        return time.time() - self.meta.get('fetched_at', 0) < fresh_for
+
+class ResponseCache:
+    """Size-bounded on-disk cache keyed by URL"""
+
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 fresh_for: int = RESPONSE_CACHE_FRESH_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fresh_for = fresh_for
+        self._total_bytes = None  # Measured lazily on first write
+        self._lock = threading.Lock()  # Size accounting and eviction
+
+    def _path(self, url: str) -> str:
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def load(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached response for url, fresh or not"""
+        path = self._path(url)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read().decode('utf-8')
+        except (OSError, ValueError):
+            return None
+
+        if meta.get('url') != url:
+            return None
+
+        # Bump mtime so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return CachedResponse(meta, body)
+
+    async def lookup(self, url: str) -> Optional[CachedResponse]:
+        """load() in a worker thread"""
+        return await asyncio.to_thread(self.load, url)
+
+    async def fresh_body(self, url: str) -> Optional[str]:
+        """Cached body if it is still inside the freshness window"""
+        cached = await self.lookup(url)
+        if cached and cached.is_fresh(self.fresh_for):
+            return cached.body
+        return None
+
+    async def store(self, url: str, body: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        await asyncio.to_thread(self._write, url, body, etag, last_modified)
+
+    def _write(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str]):
+        """Write one entry and evict if that put the cache over budget (blocking)"""
+        meta = {
+            'url': url,
+            'fetched_at': time.time(),
+            'etag': etag,
+            'last_modified': last_modified
+        }
+        data = json.dumps(meta).encode() + b'\n' + body.encode('utf-8')
+
+        path = self._path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Response cache write failed: {e}")
+            return
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._measure()
+            else:
+                self._total_bytes += len(data) - old_size
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    async def refresh(self, url: str, cached: CachedResponse):
+        """Restart the freshness window after a 304 Not Modified"""
+        await self.store(url, cached.body, cached.etag, cached.last_modified)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _measure(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is back under 90% of its budget"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+        self._total_bytes = total
+
+    async def fetch_text(self, url: str, cached: Optional[CachedResponse] = None,
+                         headers: Optional[Dict] = None, **kwargs) -> str:
+        """
+        Fetch url and cache the response. cached is the caller's stale
+        entry from lookup(), if any, revalidated with
+        If-None-Match/If-Modified-Since.
+        """
+        headers = dict(headers or {})
+        if cached:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        response = await fetch(url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and cached:
+            await self.refresh(url, cached)
+            return cached.body
+
+        response.raise_for_status()
+
+        if 'no-store' not in response.headers.get('Cache-Control', ''):
+            await self.store(
+                url,
+                response.text,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified')
+            )
+
+        return response.text
+
+
+response_cache = ResponseCache()
@@ -4,14 +4,31 @@ Supports Playwright (JS-heavy sites), Requests (static HTML), and API integratio
 """
 
 import asyncio
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
-import requests
+import fnmatch
+import json
+import os
+import re
+import time
+from urllib.parse import urlparse
 import random
-from datetime import datetime
-from sites_config import FAST_SITES, FULL_SITES
-from api_clients import EbayAPIClient, NextdoorAPIClient, EdmundsAPIClient
-from utils import extract_number, deduplicate_vehicles, passes_filters, normalize_location
+from typing import Optional
+from sites_config import FAST_SITES, FULL_SITES, MAX_RESULTS_PER_SITE
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from browser_pool import browser_pool
+from rate_limiter import rate_limiter
+from site_health import site_health
+from response_cache import response_cache
+from extractors import ExtractStats, build_vehicle
+from parse_pool import parse_pool
+from api_clients import ebay_client, nextdoor_client, edmunds_client
+from utils import compile_filters, DedupIndex
+from listing_index import listing_index
+from geo import geo_index
+from tracing import current_trace
+from metrics import (
+    containers_found, listings_passed, duplicates_dropped, observe_stage, time_stage, count_error
+)
+from vehicle import Vehicle
 
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -19,12 +36,29 @@ USER_AGENTS = [
     'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
 ]
 
+# How many sites a single search scrapes at once
+MAX_CONCURRENT_SITES = int(os.getenv('MAX_CONCURRENT_SITES', '8'))
+
+# Stop a search once this many unique listings have been streamed (0 = no cap)
+MAX_RESULTS_PER_SEARCH = int(os.getenv('MAX_RESULTS_PER_SEARCH', '0'))
+
+# wait_for_container sites: done once the listing count has held steady this long
+CONTAINER_SETTLE = int(os.getenv('CONTAINER_SETTLE_MS', '500')) / 1000
+
+# How often the listing count is checked while it settles
+CONTAINER_POLL_INTERVAL = 0.1
+
+async def wait_for_host(url: str):
+    """Wait for the rate limiter to allow a request to the host behind url"""
+    await rate_limiter.acquire(urlparse(url).netloc)
+
 def build_search_url(site: dict, params) -> str:
     """Build search URL with parameters"""
     url = site['base_url'] + site['search_path']
     
     # Replace placeholders in params
     query_params = []
+    origin = None
     for key, value in site['params'].items():
         param_value = value
         if '{keyword}' in value:
@@ -35,8 +69,14 @@ def build_search_url(site: dict, params) -> str:
             param_value = param_value.replace('{maxPrice}', str(params.maxPrice))
         if '{radius}' in value:
             param_value = param_value.replace('{radius}', str(params.radius or 50))
-        if '{zipCode}' in value and params.zipCode:
-            param_value = param_value.replace('{zipCode}', params.zipCode)
+        if '{zipCode}' in value:
+            zip_code = geo_index.search_zip(params)  # Nearest to the location when no ZIP was given
+            if zip_code:
+                param_value = param_value.replace('{zipCode}', zip_code)
+        if '{lat}' in value or '{lon}' in value:
+            origin = origin or geo_index.origin(params)
+            if origin:
+                param_value = param_value.replace('{lat}', f"{origin[0]:.4f}").replace('{lon}', f"{origin[1]:.4f}")
         if '{make}' in value and params.make:
             param_value = param_value.replace('{make}', params.make)
         
@@ -47,8 +87,8 @@ def build_search_url(site: dict, params) -> str:
     
     return url
 
-def extract_vehicle_data(container, selectors: dict, source: str) -> dict:
-    """Extract vehicle data from HTML container"""
+def extract_vehicle_data(container, selectors: dict, source: str) -> Optional[Vehicle]:
+    """Extract vehicle data from a BeautifulSoup HTML container (see extractors for the fast path)"""
     try:
         title_elem = container.select_one(selectors['title'])
         price_elem = container.select_one(selectors['price'])
@@ -58,154 +98,467 @@ def extract_vehicle_data(container, selectors: dict, source: str) -> dict:
         if not title_elem or not price_elem:
             return None
         
-        title = title_elem.get_text(strip=True)
-        price_text = price_elem.get_text(strip=True)
-        price = extract_number(price_text)
-        location = location_elem.get_text(strip=True) if location_elem else 'Unknown'
-        url = url_elem.get('href', '') if url_elem else ''
-        
-        # Make URL absolute
-        if url and not url.startswith('http'):
-            url = 'https://' + url.lstrip('/')
-        
-        vehicle = {
-            'id': f"{source}_{hash(url)}",
-            'source': source,
-            'title': title,
-            'price': price,
-            'location': normalize_location(location),
-            'url': url,
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        return vehicle
+        return build_vehicle(
+            source,
+            title_elem.get_text(strip=True),
+            price_elem.get_text(strip=True),
+            location_elem.get_text(strip=True) if location_elem else 'Unknown',
+            url_elem.get('href', '') if url_elem else ''
+        )
     except Exception as e:
         print(f"Error extracting vehicle data: {e}")
         return None
 
-async def scrape_playwright(site: dict, params) -> list:
-    """Scrape JavaScript-heavy sites using Playwright"""
-    vehicles = []
+def build_page_url(site: dict, params, page_index: int) -> str:
+    """Build the URL of a results page (0 = first page) from the site's pagination template"""
+    url = build_search_url(site, params)
+    pagination = site.get('pagination')
     
-    try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                user_agent=random.choice(USER_AGENTS),
-                viewport={'width': 1920, 'height': 1080}
-            )
-            page = await context.new_page()
-            
-            url = build_search_url(site, params)
-            print(f"Scraping {site['name']}: {url}")
-            
-            await page.goto(url, wait_until='networkidle', timeout=15000)
-            await asyncio.sleep(site['delay'])
-            
-            content = await page.content()
-            soup = BeautifulSoup(content, 'lxml')
-            
-            containers = soup.select(site['selectors']['container'])
-            print(f"Found {len(containers)} containers on {site['name']}")
-            
-            for container in containers[:20]:  # Limit to 20 results per site
-                vehicle = extract_vehicle_data(container, site['selectors'], site['name'])
-                if vehicle and passes_filters(vehicle, params):
-                    vehicles.append(vehicle)
-            
-            await browser.close()
+    if page_index == 0 or not pagination:
+        return url
     
-    except Exception as e:
-        print(f"Error scraping {site['name']} with Playwright: {e}")
+    value = pagination.get('start', 1) + page_index * pagination.get('step', 1)
+    separator = '&' if '?' in url else '?'
+    return f"{url}{separator}{pagination['param']}={value}"
+
+def page_urls(site: dict, params) -> list:
+    """URLs of every results page to fetch - only the first unless the site has a pagination template"""
+    pages = site.get('max_pages', 1) if site.get('pagination') else 1
+    return [build_page_url(site, params, idx) for idx in range(max(1, pages))]
+
+_blocked_url_patterns = {}
+
+def blocked_url_pattern(site: dict):
+    """Single compiled regex for a site's block_patterns globs, or None"""
+    patterns = site.get('block_patterns')
+    if not patterns:
+        return None
     
-    return vehicles
+    if site['name'] not in _blocked_url_patterns:
+        _blocked_url_patterns[site['name']] = re.compile('|'.join(fnmatch.translate(p) for p in patterns))
+    return _blocked_url_patterns[site['name']]
 
-def scrape_requests(site: dict, params) -> list:
-    """Scrape static HTML sites using requests"""
-    vehicles = []
+async def block_requests(page, site: dict):
+    """Abort requests for the site's blocked resource types and URL patterns"""
+    resource_types = frozenset(site.get('block_resources') or ())
+    url_pattern = blocked_url_pattern(site)
     
-    try:
-        url = build_search_url(site, params)
+    if not resource_types and not url_pattern:
+        return
+    
+    async def handle(route):
+        request = route.request
+        if request.resource_type in resource_types or (url_pattern and url_pattern.match(request.url)):
+            await route.abort()
+        else:
+            await route.continue_()
+    
+    await page.route('**/*', handle)
+
+async def settle_containers(page, selector: str, cap: float):
+    """
+    Wait for progressively rendered listings: return once the number of
+    containers stops changing for CONTAINER_SETTLE seconds, or after cap.
+    """
+    locator = page.locator(selector)
+    deadline = time.monotonic() + cap
+    count = await locator.count()
+    steady_since = time.monotonic()
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(CONTAINER_POLL_INTERVAL)
+        current = await locator.count()
+        now = time.monotonic()
+        if current != count:
+            count, steady_since = current, now
+        elif now - steady_since >= CONTAINER_SETTLE:
+            return
+
+async def render_page(site: dict, url: str) -> str:
+    """Render a page with Playwright and return its HTML"""
+    content = await response_cache.fresh_body(url)
+    if content is not None:
+        print(f"Using cached page for {site['name']}: {url}")
+        return content
+    
+    await wait_for_host(url)
+    
+    async with browser_pool.page(
+        user_agent=random.choice(USER_AGENTS),
+        viewport={'width': 1920, 'height': 1080}
+    ) as page:
         print(f"Scraping {site['name']}: {url}")
         
-        headers = {
-            'User-Agent': random.choice(USER_AGENTS),
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-        }
+        await block_requests(page, site)
+        timeout_ms = site_health.timeout(site) * 1000
         
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+        with site_health.get(site).track(), time_stage(site['name'], 'render'):
+            if site.get('wait_for_container'):
+                # Done once listings are in the DOM and have stopped arriving,
+                # never later than the fixed delay this replaces
+                container = site['selectors']['container']
+                await page.goto(url, wait_until='domcontentloaded', timeout=timeout_ms)
+                try:
+                    await page.wait_for_selector(container, state='attached', timeout=timeout_ms)
+                    await settle_containers(page, container, site['delay'])
+                except PlaywrightTimeoutError:
+                    print(f"No listings appeared on {site['name']}")
+            else:
+                await page.goto(url, wait_until='networkidle', timeout=timeout_ms)
+                await asyncio.sleep(site['delay'])
+            
+            content = await page.content()
+    
+    await response_cache.store(url, content)
+    return content
+
+async def capture_json(site: dict, url: str) -> str:
+    """
+    Load a page with Playwright and capture the JSON bodies of API responses
+    matching the site's json_capture.url_pattern, returned as a JSON array.
+    Returns as soon as the first matching response lands (plus a short settle
+    time), without waiting for the DOM to render.
+    """
+    content = await response_cache.fresh_body(url)
+    if content is not None:
+        print(f"Using cached API responses for {site['name']}: {url}")
+        return content
+    
+    capture = site['json_capture']
+    url_pattern = re.compile(fnmatch.translate(capture['url_pattern']))
+    payloads = []
+    captured = asyncio.Event()
+    
+    async def on_response(response):
+        if not url_pattern.match(response.url):
+            return
+        try:
+            payloads.append(await response.json())
+            captured.set()
+        except Exception:
+            pass  # Not JSON (or page already closed)
+    
+    await wait_for_host(url)
+    
+    async with browser_pool.page(
+        user_agent=random.choice(USER_AGENTS),
+        viewport={'width': 1920, 'height': 1080}
+    ) as page:
+        print(f"Scraping {site['name']} API responses: {url}")
+        
+        await block_requests(page, site)
+        page.on('response', on_response)
         
-        soup = BeautifulSoup(response.text, 'lxml')
-        containers = soup.select(site['selectors']['container'])
-        print(f"Found {len(containers)} containers on {site['name']}")
+        timeout = site_health.timeout(site)
         
-        for container in containers[:20]:  # Limit to 20 results per site
-            vehicle = extract_vehicle_data(container, site['selectors'], site['name'])
-            if vehicle and passes_filters(vehicle, params):
-                vehicles.append(vehicle)
+        # No matching response before the timeout counts as a failure (usually a block)
+        with time_stage(site['name'], 'render'):
+            with site_health.get(site).track():
+                await page.goto(url, wait_until='commit', timeout=timeout * 1000)
+                await asyncio.wait_for(captured.wait(), timeout=timeout)
+            
+            # Listing responses often arrive in a burst - give the rest a moment
+            await asyncio.sleep(capture.get('settle', 0.5))
     
-    except Exception as e:
-        print(f"Error scraping {site['name']} with requests: {e}")
+    content = json.dumps(payloads)
+    await response_cache.store(url, content)
+    return content
+
+async def fetch_page(site: dict, url: str) -> str:
+    """Fetch a static HTML page over the shared async HTTP client"""
+    # Fresh cached pages skip the network (and the rate limiter) entirely
+    cached = await response_cache.lookup(url)
+    if cached and cached.is_fresh(response_cache.fresh_for):
+        print(f"Using cached page for {site['name']}: {url}")
+        return cached.body
     
-    return vehicles
+    headers = {
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+    }
+    
+    await wait_for_host(url)
+    print(f"Scraping {site['name']}: {url}")
+    
+    with site_health.get(site).track(), time_stage(site['name'], 'fetch'):
+        return await response_cache.fetch_text(url, cached, headers=headers, timeout=site_health.timeout(site))
 
-async def search_all_sites(params, total_sites: int = 10):
+async def scrape_pages(site: dict, params, filters, load_page):
     """
-    Main orchestrator - search all configured sites and stream results.
-    Yields progress and result events.
+    Load the first results page, then, only if it falls short of the site's
+    result target, the rest of its max_pages concurrently. Yields each page's
+    vehicles in page order, stopping once the target is met.
     """
-    sites = FAST_SITES[:total_sites] if total_sites <= 10 else FULL_SITES[:total_sites]
-    all_vehicles = []
-    
-    # Initialize API clients
-    ebay_client = EbayAPIClient()
-    nextdoor_client = NextdoorAPIClient()
-    edmunds_client = EdmundsAPIClient()
-    
-    for idx, site in enumerate(sites, 1):
-        # Send progress event
-        yield {
-            'type': 'progress',
-            'current': idx,
-            'total': len(sites),
-            'site': site['name']
-        }
-        
-        vehicles = []
+    filters = filters or compile_filters(params)
+    target = site.get('max_results', MAX_RESULTS_PER_SITE)
+    
+    async def scrape_page(page_number: int, url: str) -> Optional[list]:
+        """The page's vehicles, or None if it couldn't be loaded"""
+        try:
+            content = await load_page(site, url)
+        except Exception as e:
+            print(f"Error scraping {site['name']} page {page_number} with {site['method']}: {e}")
+            count_error(site['name'], e)
+            return None
         
+        stats = ExtractStats()
+        start = time.perf_counter()
         try:
-            # Try API first if configured
-            if site['name'] == 'eBay Motors' and ebay_client.is_configured():
-                print(f"Using eBay API for {site['name']}")
-                vehicles = await ebay_client.search_vehicles(params)
-            elif site['name'] == 'Nextdoor' and nextdoor_client.is_configured():
-                print(f"Using Nextdoor API for {site['name']}")
-                vehicles = await nextdoor_client.search_marketplace(params)
-            elif site['name'] == 'Edmunds' and edmunds_client.is_configured():
-                print(f"Using Edmunds API for {site['name']}")
-                vehicles = await edmunds_client.search_inventory(params)
-            # Fallback to scraping
-            elif site['method'] == 'playwright':
-                vehicles = await scrape_playwright(site, params)
-            else:
-                vehicles = scrape_requests(site, params)
+            vehicles = await parse_pool.extract(site, content, target, params, filters, stats)
+        except Exception as e:
+            # One unparseable page shouldn't cost the site its other pages
+            print(f"Error parsing {site['name']} page {page_number}: {e}")
+            count_error(site['name'], e)
+            return []
+        observe_stage(site['name'], 'parse', time.perf_counter() - start - stats.filter_seconds)
+        observe_stage(site['name'], 'filter', stats.filter_seconds)
+        containers_found.inc((site['name'],), stats.containers)
+        listings_passed.inc((site['name'],), len(vehicles))
+        trace = current_trace()
+        if trace is not None:
+            trace.page(site['name'], len((content or '').encode()), stats.containers, len(vehicles))
+        
+        print(f"Found {len(vehicles)} matching listings on {site['name']} page {page_number}")
+        return vehicles
+    
+    urls = page_urls(site, params)
+    first = await scrape_page(1, urls[0])
+    found = 0
+    if first:
+        found = len(first[:target])
+        yield first[:target]
+    
+    # Page 1 usually meets the target; a site that couldn't serve it isn't asked for more
+    if first is None or found >= target or len(urls) == 1:
+        return
+    
+    tasks = [
+        asyncio.create_task(scrape_page(page_number, url))
+        for page_number, url in enumerate(urls[1:], 2)
+    ]
+    
+    try:
+        for task in tasks:
+            vehicles = (await task or [])[:target - found]
+            if vehicles:
+                found += len(vehicles)
+                yield vehicles
+            
+            if found >= target:
+                break
+    finally:
+        # Target met or search cancelled - drop pages still loading
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def scrape_playwright(site: dict, params, filters=None):
+    """Scrape JavaScript-heavy sites using Playwright, yielding vehicles page by page"""
+    async for vehicles in scrape_pages(site, params, filters, render_page):
+        yield vehicles
+
+async def scrape_playwright_json(site: dict, params, filters=None):
+    """Scrape JS-heavy sites from their captured API responses, yielding vehicles page by page"""
+    async for vehicles in scrape_pages(site, params, filters, capture_json):
+        yield vehicles
+
+async def scrape_requests(site: dict, params, filters=None):
+    """Scrape static HTML sites over the shared async HTTP client, yielding vehicles page by page"""
+    async for vehicles in scrape_pages(site, params, filters, fetch_page):
+        yield vehicles
+
+class SiteSkipped(Exception):
+    """Raised by search_site when a site is not searched at all (e.g. its circuit is open)"""
+
+async def search_site(site: dict, params, filters=None):
+    """
+    Search a single site, preferring its API client when one is configured.
+    Yields batches of vehicles as they become available.
+    """
+    # Try API first if configured
+    if site['name'] == 'eBay Motors' and ebay_client.is_configured():
+        print(f"Using eBay API for {site['name']}")
+        with time_stage(site['name'], 'fetch'):
+            vehicles = await ebay_client.search_vehicles(params)
+        yield vehicles
+        return
+    if site['name'] == 'Nextdoor' and nextdoor_client.is_configured():
+        print(f"Using Nextdoor API for {site['name']}")
+        with time_stage(site['name'], 'fetch'):
+            vehicles = await nextdoor_client.search_marketplace(params)
+        yield vehicles
+        return
+    if site['name'] == 'Edmunds' and edmunds_client.is_configured():
+        print(f"Using Edmunds API for {site['name']}")
+        with time_stage(site['name'], 'fetch'):
+            vehicles = await edmunds_client.search_inventory(params)
+        yield vehicles
+        return
+    
+    # Fallback to scraping, unless the site's circuit breaker is open
+    if not site_health.get(site).allow():
+        raise SiteSkipped(f"Skipping {site['name']}: circuit open")
+    
+    scrapers = {
+        'playwright': scrape_playwright,
+        'playwright_json': scrape_playwright_json,
+    }
+    scraper = scrapers.get(site['method'], scrape_requests)
+    async for vehicles in scraper(site, params, filters):
+        yield vehicles
+
+async def search_all_sites(params, total_sites: int = 10, max_concurrency: int = MAX_CONCURRENT_SITES,
+                           max_results: int = MAX_RESULTS_PER_SEARCH, before_site=None):
+    """
+    Main orchestrator - search all configured sites concurrently and stream results.
+    Results are yielded as each site's pages arrive, and a progress event as
+    each site finishes; duplicates of listings already streamed are dropped.
+    Stops early once max_results unique listings have been sent (0 = no cap,
+    overridden by params.targetResults) or params.deadlineMs has elapsed,
+    and ends with a complete event naming the sites that were skipped or cut off.
+    In 'instant' mode, matching listings from the local index are sent first.
+    Every listing scraped is written to the index.
+    When the search's ZIP code (or location) can be placed, listings farther
+    than params.radius miles are dropped and each batch is sent nearest first.
+    before_site, if given, is awaited before each site starts (background
+    searches use it to back off while live searches run).
+    """
+    started = time.monotonic()
+    sites = FAST_SITES[:total_sites] if total_sites <= 10 else FULL_SITES[:total_sites]
+    dedup = DedupIndex()
+    filters = compile_filters(params)
+    origin = geo_index.origin(params)
+    
+    if params.targetResults and params.targetResults > 0:
+        max_results = params.targetResults
+    deadline_ms = params.deadlineMs
+    deadline = started + deadline_ms / 1000 if deadline_ms and deadline_ms > 0 else None
+    
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    queue = asyncio.Queue()
+    skipped = []
+    trace = current_trace()
+    
+    async def run_site(site: dict):
+        queued = time.perf_counter()
+        if trace is not None:
+            trace.span(site['name'])
+        async with semaphore:
+            if before_site is not None:
+                await before_site()
+            observe_stage(site['name'], 'queue', time.perf_counter() - queued)
+            if trace is not None:
+                trace.site_started(site['name'])
+            error = None
+            try:
+                async for vehicles in search_site(site, params, filters):
+                    await queue.put((site, vehicles))
+            except SiteSkipped as e:
+                print(e)
+                skipped.append(site['name'])
+                count_error(site['name'], e)
+                error = e
+            except Exception as e:
+                print(f"Site {site['name']} failed: {e}")
+                count_error(site['name'], e)
+                error = e
+            finally:
+                if trace is not None:
+                    trace.site_finished(site['name'], error)
+                await queue.put((site, None))  # Site finished
+    
+    tasks = [asyncio.create_task(run_site(site)) for site in sites]
+    done = set()
+    sent = 0
+    found = []
+    reason = 'finished'
+    
+    try:
+        if params.searchMode == 'instant':
+            # Answer from the index while the scrapers spin up
+            try:
+                indexed = filters.filter(await asyncio.to_thread(listing_index.search, params))
+            except Exception as e:
+                print(f"Listing index search failed: {e}")
+                indexed = []
+            
+            unique = dedup.add_batch(geo_index.within_radius(indexed, origin, params.radius))
+            if max_results:
+                unique = unique[:max_results - sent]
+            print(f"Found {len(unique)} listings in the index")
             
-            # Stream each vehicle as found
-            for vehicle in vehicles:
-                all_vehicles.append(vehicle)
+            for vehicle in unique:
+                sent += 1
                 yield {
                     'type': 'result',
-                    'vehicle': vehicle
+                    'vehicle': vehicle,
+                    'indexed': True
                 }
         
-        except Exception as e:
-            print(f"Site {site['name']} failed: {e}")
+        while len(done) < len(sites) and not (max_results and sent >= max_results):
+            try:
+                if deadline is None:
+                    site, vehicles = await queue.get()
+                else:
+                    site, vehicles = await asyncio.wait_for(queue.get(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                print(f"Reached {deadline_ms}ms deadline, stopping search")
+                reason = 'deadline'
+                break
+            
+            if vehicles is None:
+                done.add(site['name'])
+                
+                # Send progress event
+                yield {
+                    'type': 'progress',
+                    'current': len(done),
+                    'total': len(sites),
+                    'site': site['name']
+                }
+                continue
+            
+            found.extend(vehicles)  # Indexed even if a copy was already sent (or out of range)
+            vehicles = geo_index.within_radius(vehicles, origin, params.radius)
+            
+            # Stream each new vehicle as found, dropping duplicates of ones already sent
+            with time_stage(site['name'], 'dedup'):
+                unique = dedup.add_batch(vehicles)
+            duplicates_dropped.inc((site['name'],), len(vehicles) - len(unique))
+            if max_results:
+                unique = unique[:max_results - sent]
+            if trace is not None:
+                trace.sent(site['name'], len(unique), len(vehicles) - len(unique))
+            
+            for vehicle in unique:
+                sent += 1
+                yield {
+                    'type': 'result',
+                    'vehicle': vehicle
+                }
         
-        # Random delay between sites to be polite
-        await asyncio.sleep(random.uniform(1.0, 2.5))
+        if max_results and sent >= max_results:
+            print(f"Reached {max_results} results, stopping search")
+            reason = 'target'
+    finally:
+        # Client went away, target/deadline reached or we finished - don't leave scrapers running
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    print(f"Total found: {dedup.seen}, Unique: {dedup.unique}, Sent: {sent}")
+    
+    try:
+        await asyncio.to_thread(listing_index.add, found, params.location)
+    except Exception as e:
+        print(f"Listing index write failed: {e}")
     
-    # Final deduplication
-    unique_vehicles = deduplicate_vehicles(all_vehicles)
-    print(f"Total found: {len(all_vehicles)}, Unique: {len(unique_vehicles)}")
+    yield {
+        'type': 'complete',
+        'reason': reason,
+        'results': sent,
+        'elapsedMs': int((time.monotonic() - started) * 1000),
+        'skipped': skipped,
+        'cutOff': [site['name'] for site in sites if site['name'] not in done]
+    }
@@ -0,0 +1,402 @@
+"""
+Query-level search result cache.
+Finished searches are kept (TTL + LRU) as the event sequence they streamed,
+and identical searches that arrive while one is running attach to it
+instead of starting another fan-out. With several workers, finished
+searches are also written to the shared store so every worker can serve
+them, and a search running in one worker is followed by the others: the
+worker holding the search's lease publishes its events to the shared
+store as they arrive and the rest stream them from there.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from scrapers import search_all_sites, MAX_CONCURRENT_SITES
+from shared_store import shared_store
+from sse import dumps, loads
+from vehicle import Vehicle
+
+# How long a finished search is served from cache (seconds)
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '300'))
+
+# Max cached searches before least-recently-used ones are evicted
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '256'))
+
+# Multiple workers: a search whose worker stopped publishing is taken over after this (seconds)
+SEARCH_LEASE_TTL = int(os.getenv('SEARCH_LEASE_TTL', '30'))
+
+# Multiple workers: how often a running search's new events are published and polled (seconds)
+SEARCH_FOLLOW_INTERVAL = float(os.getenv('SEARCH_FOLLOW_INTERVAL', '0.25'))
+
+def normalize_params(params) -> Dict:
+    """Canonical form of SearchParams so trivially different requests share a cache entry"""
+    normalized = {}
+
+    for key, value in params.model_dump().items():
+        if isinstance(value, str):
+            value = ' '.join(value.lower().split()) or None
+        elif isinstance(value, list):
+            value = sorted(' '.join(str(v).lower().split()) for v in value) or None
+        normalized[key] = value
+
+    return normalized
+
+def cache_key(params, total_sites: int) -> str:
+    """Stable cache key for a search"""
+    return json.dumps([normalize_params(params), total_sites], sort_keys=True, separators=(',', ':'))
+
+def revive_events(events: List[Dict]) -> List[Dict]:
+    """Events read back from the shared store, with result vehicles as Vehicles again"""
+    for event in events:
+        if event['type'] == 'result':
+            event['vehicle'] = Vehicle.from_dict(event['vehicle'])
+    return events
+
+def decode_events(data: bytes) -> List[Dict]:
+    return revive_events(loads(data))
+
+def shared_name(key: str) -> str:
+    """Short stable name for a cache key in the shared store's leases"""
+    return 'search:' + hashlib.sha1(key.encode()).hexdigest()
+
+class SharedSearchError(Exception):
+    """A search followed from another worker failed or was abandoned there"""
+
+class InFlightSearch:
+    """A running search whose events can be followed by any number of requests"""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.task = None
+        self._updated = asyncio.Event()
+
+    def append(self, event: Dict):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def follow(self):
+        """Yield every event so far, then new ones until the search finishes"""
+        idx = 0
+        while True:
+            updated = self._updated
+
+            while idx < len(self.events):
+                yield self.events[idx]
+                idx += 1
+
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+
+            await updated.wait()
+
+class SearchCache:
+    """TTL + LRU cache of finished searches with single-flight for running ones"""
+
+    def __init__(self, ttl: int = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_MAX_ENTRIES, store=None,
+                 lease_ttl: int = SEARCH_LEASE_TTL, follow_interval: float = SEARCH_FOLLOW_INTERVAL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self.follow_interval = follow_interval
+        self._entries = OrderedDict()  # key -> (expires_at, events)
+        self._in_flight = {}
+        self._prefetching = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.followed = 0  # Searches streamed from another worker
+
+    async def get(self, key: str) -> Optional[List[Dict]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, events = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                return events
+            del self._entries[key]
+
+        return await self._get_shared(key)
+
+    def _read_shared(self, key: str) -> Optional[Tuple[List[Dict], float]]:
+        """(events, seconds left) of a search in the shared store (blocking, run off the loop)"""
+        data = self.store.get('search', key)
+        if data is None:
+            return None
+        return decode_events(data), self.store.expires_in('search', key)
+
+    async def _get_shared(self, key: str) -> Optional[List[Dict]]:
+        """A search finished by another worker, kept locally for the rest of its TTL"""
+        if self.store is None:
+            return None
+
+        try:
+            shared = await asyncio.to_thread(self._read_shared, key)
+        except Exception as e:
+            print(f"Shared search cache read failed: {e}")
+            return None
+        if shared is None:
+            return None
+
+        events, ttl = shared
+        self._remember(key, events, ttl)
+        return events
+
+    def _remember(self, key: str, events: List[Dict], ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, events)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def put(self, key: str, events: List[Dict]):
+        self._remember(key, events, self.ttl)
+        if self.store is not None:
+            try:
+                await asyncio.to_thread(lambda: self.store.put('search', key, dumps(events), self.ttl))
+            except Exception as e:
+                print(f"Shared search cache write failed: {e}")
+
+    async def expires_in(self, key: str) -> float:
+        """Seconds until the cached search expires (0 if it isn't cached)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            return max(0.0, entry[0] - time.monotonic())
+        if self.store is not None:
+            return await asyncio.to_thread(self.store.expires_in, 'search', key)
+        return 0.0
+
+    def clear(self):
+        self._entries.clear()
+
+    @property
+    def live_searches(self) -> int:
+        """Running searches started by clients rather than the prefetcher"""
+        return len(self._in_flight) - len(self._prefetching)
+
+    async def _start(self, key: str, flight: InFlightSearch, params, total_sites: int,
+                     max_concurrency: int = MAX_CONCURRENT_SITES, before_site=None):
+        """Run the search here, or follow it if another worker holds its lease"""
+        try:
+            if self.store is None:
+                await self._run(key, flight, params, total_sites, max_concurrency, before_site)
+            elif await self._lead(key):
+                await self._run_shared(key, flight, params, total_sites, max_concurrency, before_site)
+            else:
+                await self._follow(key, flight, params, total_sites, max_concurrency, before_site)
+        except Exception as e:
+            if not flight.done:  # Never leave followers waiting
+                flight.finish(e)
+        finally:
+            self._in_flight.pop(key, None)
+            self._prefetching.discard(key)
+
+    async def _run(self, key: str, flight: InFlightSearch, params, total_sites: int,
+                   max_concurrency: int = MAX_CONCURRENT_SITES, before_site=None):
+        try:
+            async for event in search_all_sites(params, total_sites, max_concurrency, before_site=before_site):
+                flight.append(event)
+        except Exception as e:
+            flight.finish(e)
+        else:
+            flight.finish()
+            # A search cut short by its deadline is missing the slow sites - don't pin that for the TTL
+            if self._cacheable(flight.events):
+                await self.put(key, flight.events)
+
+    @staticmethod
+    def _cacheable(events: List[Dict]) -> bool:
+        complete = events[-1] if events else {}
+        return complete.get('reason') != 'deadline'
+
+    async def _lead(self, key: str) -> bool:
+        """Take the search's lease; if the store fails, run the search here"""
+        try:
+            return await asyncio.to_thread(self.store.acquire_lease, shared_name(key), self.lease_ttl)
+        except Exception as e:
+            print(f"Search lease failed: {e}")
+            return True
+
+    async def _run_shared(self, key: str, flight: InFlightSearch, params, total_sites: int,
+                          max_concurrency: int = MAX_CONCURRENT_SITES, before_site=None):
+        """Run the search while publishing its events for other workers to follow"""
+        publisher = asyncio.create_task(self._publish(key, flight))
+        try:
+            await self._run(key, flight, params, total_sites, max_concurrency, before_site)
+        finally:
+            await asyncio.gather(publisher, return_exceptions=True)
+            try:
+                await asyncio.to_thread(self.store.release_lease, shared_name(key))
+            except Exception as e:
+                print(f"Search lease release failed: {e}")
+
+    def _write_chunk(self, name: str, run: str, number: int, events: List[Dict], done: bool, error: Optional[str]):
+        """Publish events number..; chunks outlive the run so late followers can replay it (blocking)"""
+        self.store.put('flight', f"{run}#{number}", dumps([done, error, events]), self.ttl)
+        if number == 0:
+            self.store.put('flight', name, run.encode(), self.ttl)
+        if done:
+            self.store.delete('flight', name)  # New followers use the cached result or start a new run
+
+    async def _publish(self, key: str, flight: InFlightSearch):
+        """Write the flight's new events as numbered chunks until it finishes, renewing the lease"""
+        name = shared_name(key)
+        run = uuid.uuid4().hex
+        sent = 0
+        number = 0
+        renewed = time.monotonic()
+
+        while True:
+            done = flight.done
+            events = flight.events[sent:]
+            try:
+                if events or done or number == 0:
+                    error = f"{type(flight.error).__name__}: {flight.error}" if flight.error else None
+                    await asyncio.to_thread(self._write_chunk, name, run, number, events, done, error)
+                    sent += len(events)
+                    number += 1
+                # Followers take over a search whose lease lapses, so keep it while running
+                if not done and time.monotonic() - renewed > self.lease_ttl / 3:
+                    await asyncio.to_thread(self.store.acquire_lease, name, self.lease_ttl)
+                    renewed = time.monotonic()
+            except Exception as e:
+                print(f"Publishing search events failed: {e}")
+                return
+            if done:
+                return
+            await asyncio.sleep(self.follow_interval)
+
+    def _read_chunk(self, name: str, run: Optional[str], number: int) -> Tuple[Optional[str], Optional[bytes]]:
+        if run is None:
+            data = self.store.get('flight', name)
+            if data is None:
+                return None, None
+            run = data.decode()
+        return run, self.store.get('flight', f"{run}#{number}")
+
+    async def _follow(self, key: str, flight: InFlightSearch, params, total_sites: int,
+                      max_concurrency: int = MAX_CONCURRENT_SITES, before_site=None):
+        """Stream another worker's run of the search, taking over if that worker stops"""
+        name = shared_name(key)
+        run = None
+        number = 0
+
+        while True:
+            run, data = await asyncio.to_thread(self._read_chunk, name, run, number)
+
+            if data is not None:
+                if number == 0:
+                    self.followed += 1
+                done, error, events = loads(data)
+                for event in revive_events(events):
+                    flight.append(event)
+                number += 1
+                if done:
+                    flight.finish(SharedSearchError(error) if error else None)
+                    if not error and self._cacheable(flight.events):
+                        self._remember(key, flight.events, self.ttl)
+                    return
+                continue
+
+            if await self._lead(key):
+                # Finished (and released) between our read and the lease check?
+                run, data = await asyncio.to_thread(self._read_chunk, name, run, number)
+                if data is not None:
+                    await asyncio.to_thread(self.store.release_lease, name)
+                    continue
+                if flight.events:
+                    await asyncio.to_thread(self.store.release_lease, name)
+                    raise SharedSearchError('the worker running this search stopped')
+                cached = await self._get_shared(key)
+                if cached is not None:
+                    await asyncio.to_thread(self.store.release_lease, name)
+                    for event in cached:
+                        flight.append(event)
+                    flight.finish()
+                    return
+                await self._run_shared(key, flight, params, total_sites, max_concurrency, before_site)
+                return
+
+            await asyncio.sleep(self.follow_interval)
+
+    async def search(self, params, total_sites: int = 10, fresh: bool = False):
+        """
+        Stream search events, served from cache, from an identical running
+        search, or from a new fan-out - in that order of preference.
+        fresh skips the cache but still joins a running search.
+        """
+        key = cache_key(params, total_sites)
+
+        events = None if fresh else await self.get(key)
+        if events is not None:
+            self.hits += 1
+            for event in events:
+                yield event
+            return
+
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            flight = InFlightSearch()
+            self._in_flight[key] = flight
+            # Runs detached so followers still get results if the first client leaves
+            flight.task = asyncio.create_task(self._start(key, flight, params, total_sites))
+
+        async for event in flight.follow():
+            yield event
+
+    async def refresh(self, params, total_sites: int = 10, max_concurrency: int = MAX_CONCURRENT_SITES,
+                      before_site=None) -> bool:
+        """
+        Re-run a search in the background and replace its cache entry.
+        Clients asking for it meanwhile follow the refresh, and before_site
+        (see search_all_sites) can hold it back. Returns False if the search
+        failed or was already running.
+        """
+        key = cache_key(params, total_sites)
+        if key in self._in_flight:
+            return False
+
+        flight = InFlightSearch()
+        self._in_flight[key] = flight
+        self._prefetching.add(key)
+        flight.task = asyncio.create_task(
+            self._start(key, flight, params, total_sites, max_concurrency, before_site)
+        )
+        await asyncio.shield(flight.task)
+        return flight.error is None
+
+    def stats(self) -> Dict:
+        return {
+            'entries': len(self._entries),
+            'in_flight': len(self._in_flight),
+            'prefetching': len(self._prefetching),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'followed': self.followed
+        }
+
+
+search_cache = SearchCache(store=shared_store)
@@ -0,0 +1,164 @@
+"""
+SQLite-backed state shared by every worker process on this machine.
+When the app runs with several uvicorn workers, finished searches,
+per-host rate-limit buckets, circuit breaker state and the prefetch
+leader lease live here instead of in each process's memory, so adding
+workers adds throughput without multiplying outbound scrape traffic.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# Workers uvicorn starts (uvicorn reads the same variable)
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# Share state across workers (default: on when running more than one worker)
+SHARED_STATE = os.getenv('SHARED_STATE', '1' if WEB_CONCURRENCY > 1 else '0') == '1'
+
+SHARED_STORE_PATH = os.getenv('SHARED_STORE_PATH', '.cache/shared.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    host TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+class SharedStore:
+    """Small cross-process store: expiring key/values, token buckets and leases"""
+
+    def __init__(self, path: str = SHARED_STORE_PATH):
+        self.path = path
+        self.owner = f"{os.getpid()}"
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            # Autocommit; multi-statement updates use explicit BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row[0]
+
+    def expires_in(self, namespace: str, key: str) -> float:
+        """Seconds until key expires (0 if missing, inf if it never expires)"""
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT expires_at FROM kv WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+        if row is None:
+            return 0.0
+        return float('inf') if row[0] is None else max(0.0, row[0] - time.time())
+
+    def put(self, namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                (namespace, key, value, expires_at)
+            )
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._connect().execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key))
+
+    def items(self, namespace: str) -> List[Tuple[str, bytes]]:
+        """Every unexpired (key, value) in a namespace"""
+        with self._lock:
+            return self._connect().execute(
+                'SELECT key, value FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (namespace, time.time())
+            ).fetchall()
+
+    def purge(self):
+        """Delete expired keys and leases"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))
+            conn.execute('DELETE FROM leases WHERE expires_at <= ?', (now,))
+
+    def take_token(self, host: str, per_second: float, burst: int) -> float:
+        """
+        Take a token from host's shared bucket, returning how long to wait
+        until it is actually available (see rate_limiter.TokenBucket.reserve).
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE host = ?', (host,)).fetchone()
+                tokens = float(burst) if row is None else min(burst, row[0] + (now - row[1]) * per_second)
+                tokens -= 1
+                conn.execute('INSERT OR REPLACE INTO buckets (host, tokens, updated_at) VALUES (?, ?, ?)',
+                             (host, tokens, now))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+        return 0.0 if tokens >= 0 else -tokens / per_second
+
+    def bucket_tokens(self, host: str) -> Optional[float]:
+        with self._lock:
+            row = self._connect().execute('SELECT tokens FROM buckets WHERE host = ?', (host,)).fetchone()
+        return row[0] if row else None
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """Take or renew a named lease; False while another process holds it"""
+        now = time.time()
+        with self._lock:
+            cursor = self._connect().execute(
+                'INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+                'WHERE leases.owner = excluded.owner OR leases.expires_at <= ?',
+                (name, self.owner, now + ttl, now)
+            )
+        return cursor.rowcount > 0
+
+    def release_lease(self, name: str):
+        """Give up a lease this process holds"""
+        with self._lock:
+            self._connect().execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, self.owner))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# None when running a single worker: everything stays in process memory
+shared_store = SharedStore() if SHARED_STATE else None
@@ -0,0 +1,263 @@
+"""
+Per-site health tracking: rolling latency/failure stats, adaptive timeouts
+and circuit breakers.
+A site's timeout follows its observed p95 latency instead of a fixed
+10-15s, and a site that keeps failing is skipped for a cooldown period,
+then probed with a single request before it is trusted again. With
+several workers, breaker state is exchanged through the shared store in
+the background, so a breaker opened by one worker is honoured by all of
+them within BREAKER_SYNC_INTERVAL; latency stats stay per worker.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+from sites_config import DEFAULT_TIMEOUT
+from shared_store import shared_store
+
+# Requests remembered per site for latency/failure stats
+HEALTH_WINDOW = int(os.getenv('HEALTH_WINDOW', '50'))
+
+# Timeout = p95 latency x this, clamped to [MIN_TIMEOUT, site timeout]
+TIMEOUT_P95_MULTIPLIER = float(os.getenv('TIMEOUT_P95_MULTIPLIER', '2.0'))
+MIN_TIMEOUT = float(os.getenv('MIN_TIMEOUT', '3'))
+
+# Breaker opens when at least BREAKER_MIN_SAMPLES requests are in the window
+# and BREAKER_FAILURE_RATE of them failed, or after BREAKER_MAX_CONSECUTIVE
+# failures in a row
+BREAKER_MIN_SAMPLES = int(os.getenv('BREAKER_MIN_SAMPLES', '5'))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_MAX_CONSECUTIVE = int(os.getenv('BREAKER_MAX_CONSECUTIVE', '3'))
+
+# Seconds an open breaker skips the site before letting a probe through
+BREAKER_COOLDOWN = int(os.getenv('BREAKER_COOLDOWN', '120'))
+
+# Longest a breaker change takes to reach the other workers (multiple workers only)
+BREAKER_SYNC_INTERVAL = float(os.getenv('BREAKER_SYNC_INTERVAL', '1'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class SiteHealth:
+    """Rolling stats and circuit breaker for one site"""
+
+    def __init__(self, name: str, window: int = HEALTH_WINDOW, on_change=None):
+        self.name = name
+        self.on_change = on_change  # Called with self when breaker state changes
+        self.changed_at = 0.0
+        self.latencies = deque(maxlen=window)  # successful request durations
+        self.outcomes = deque(maxlen=window)   # True = success
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.last_error = None
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(pct * (len(ordered) - 1))]
+
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def timeout(self, default: float) -> float:
+        """Timeout derived from p95 latency, or default until there are enough samples"""
+        if len(self.latencies) < BREAKER_MIN_SAMPLES:
+            return default
+        return max(MIN_TIMEOUT, min(default, self.percentile(0.95) * TIMEOUT_P95_MULTIPLIER))
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (open breakers let one probe through after the cooldown)"""
+        now = time.time()
+
+        if self.state == CLOSED:
+            return True
+
+        if self.state == OPEN:
+            if now - self.opened_at < BREAKER_COOLDOWN:
+                return False
+            self._set_state(HALF_OPEN)
+            print(f"Circuit half-open for {self.name}, probing")
+
+        # Half-open: one probe at a time (a probe that never reported back expires after the cooldown)
+        if self.probe_started_at is not None and now - self.probe_started_at < BREAKER_COOLDOWN:
+            return False
+        self.probe_started_at = now
+        self._publish()
+        return True
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+
+        if self.state != CLOSED:
+            print(f"Circuit closed for {self.name}")
+            self.probe_started_at = None
+            self._set_state(CLOSED)
+            # Start the failure rate over so old failures can't reopen it straight away
+            self.outcomes.clear()
+            self.outcomes.append(True)
+
+    def record_failure(self, error: Exception):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        message = str(error).splitlines()[0] if str(error) else ''
+        self.last_error = f"{type(error).__name__}: {message}".rstrip(': ')
+
+        if self.state == HALF_OPEN:
+            self._open()
+        elif self.state == CLOSED and (
+            self.consecutive_failures >= BREAKER_MAX_CONSECUTIVE
+            or (len(self.outcomes) >= BREAKER_MIN_SAMPLES and self.failure_rate() >= BREAKER_FAILURE_RATE)
+        ):
+            self._open()
+
+    def _open(self):
+        print(f"Circuit open for {self.name} ({self.last_error}), skipping for {BREAKER_COOLDOWN}s")
+        self.opened_at = time.time()
+        self.probe_started_at = None
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        self.changed_at = time.time()
+        self._publish()
+
+    def _publish(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def breaker_state(self) -> Dict:
+        return {
+            'state': self.state,
+            'opened_at': self.opened_at,
+            'probe_started_at': self.probe_started_at,
+            'last_error': self.last_error,
+            'changed_at': self.changed_at
+        }
+
+    def adopt(self, shared: Dict):
+        """Take breaker state another worker changed more recently"""
+        if shared['changed_at'] > self.changed_at or shared['probe_started_at'] != self.probe_started_at:
+            if shared['state'] == CLOSED and self.state != CLOSED:
+                self.outcomes.clear()
+                self.consecutive_failures = 0
+            self.state = shared['state']
+            self.opened_at = shared['opened_at']
+            self.probe_started_at = shared['probe_started_at']
+            self.last_error = shared['last_error']
+            self.changed_at = shared['changed_at']
+
+    @contextmanager
+    def track(self):
+        """Time a network request, recording success or failure (cancellation is neither)"""
+        started = time.time()
+        try:
+            yield
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        else:
+            self.record_success(time.time() - started)
+
+    def status(self, default_timeout: float) -> Dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        status = {
+            'state': self.state,
+            'samples': len(self.outcomes),
+            'failure_rate': round(self.failure_rate(), 3),
+            'consecutive_failures': self.consecutive_failures,
+            'latency_p50': round(p50, 3) if p50 is not None else None,
+            'latency_p95': round(p95, 3) if p95 is not None else None,
+            'timeout': round(self.timeout(default_timeout), 3),
+            'last_error': self.last_error,
+        }
+        if self.state == OPEN:
+            status['retry_in'] = round(max(0.0, BREAKER_COOLDOWN - (time.time() - self.opened_at)), 1)
+        return status
+
+class SiteHealthRegistry:
+    """
+    SiteHealth for every site, created on first use. With a shared store,
+    breaker changes are queued and written by a background task, which
+    also adopts the other workers' changes, so requests never wait on SQLite.
+    """
+
+    def __init__(self, store=None, sync_interval: float = BREAKER_SYNC_INTERVAL):
+        self.store = store
+        self.sync_interval = sync_interval
+        self._sites = {}
+        self._pending = {}  # site name -> breaker state not yet written
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def get(self, site: Dict) -> SiteHealth:
+        return self._health(site['name'])
+
+    def _health(self, name: str) -> SiteHealth:
+        health = self._sites.get(name)
+        if health is None:
+            on_change = self._queue if self.store is not None else None
+            health = self._sites[name] = SiteHealth(name, on_change=on_change)
+        return health
+
+    def _queue(self, health: SiteHealth):
+        self._pending[health.name] = health.breaker_state()
+        self._changed.set()
+
+    def _exchange(self, pending: Dict) -> list:
+        """Write our changes and read everyone's breaker state (blocking, run off the loop)"""
+        for name, state in pending.items():
+            self.store.put('breaker', name, json.dumps(state).encode())
+        return self.store.items('breaker')
+
+    async def sync(self):
+        """Publish queued changes and adopt newer ones from other workers"""
+        pending, self._pending = self._pending, {}
+        shared = await asyncio.to_thread(self._exchange, pending)
+        for name, data in shared:
+            # Changed again while we were writing: ours is newer
+            if name not in self._pending:
+                self._health(name).adopt(json.loads(data))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Breaker state sync failed: {e}")
+
+    def start(self):
+        if self.store is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def timeout(self, site: Dict) -> float:
+        return self.get(site).timeout(site.get('timeout', DEFAULT_TIMEOUT))
+
+    def status(self, sites: list) -> Dict:
+        return {site['name']: self.get(site).status(site.get('timeout', DEFAULT_TIMEOUT)) for site in sites}
+
+
+site_health = SiteHealthRegistry(store=shared_store)
@@ -3,6 +3,50 @@ Configuration for 35+ vehicle listing sites.
 Each site config includes scraping method, selectors, and parameters.
 """
 
+# Request timeout (seconds) for sites that don't set their own
+DEFAULT_TIMEOUT = 10
+
+# Outbound request budget per host, shared by all searches in the process:
+# 'per_second' tokens refill continuously up to 'burst'. Sites can override
+# it with their own 'rate_limit'.
+DEFAULT_RATE_LIMIT = {'per_second': 0.5, 'burst': 2}
+
+# Listings kept per site for sites that don't set 'max_results'
+MAX_RESULTS_PER_SITE = 20
+
+# 'pagination' describes how to reach results page N (0-based) of a site:
+# the query param 'param' is set to start + N * step. Sites without it
+# only fetch their first page, whatever their 'max_pages'. Later pages are
+# only requested when page 1 falls short of the site's 'max_results'.
+
+# Lean page loads for Playwright sites:
+# 'block_resources' - Playwright resource types to abort (image, media, font, stylesheet, ...)
+# 'block_patterns' - URL globs to abort, e.g. analytics and ad scripts
+# 'wait_for_container' - wait for listing containers to appear and stop arriving instead of
+#   network idle + 'delay' (which becomes the cap)
+LEAN_BLOCKED_RESOURCES = ['image', 'media', 'font', 'stylesheet']
+
+TRACKER_URL_PATTERNS = [
+    '*google-analytics.com*',
+    '*googletagmanager.com*',
+    '*doubleclick.net*',
+    '*googlesyndication.com*',
+    '*hotjar.com*',
+    '*segment.io*',
+    '*optimizely.com*',
+    '*nr-data.net*',
+    '*scorecardresearch.com*',
+]
+
+# 'playwright_json' sites skip DOM parsing: the page is loaded in Playwright,
+# API responses whose URL matches 'json_capture.url_pattern' are captured,
+# and listings are read from 'items_path' using the 'fields' map
+# (vehicle field -> dotted path inside each item). 'url_template' is
+# formatted with the mapped fields to build the listing URL.
+# The Facebook Marketplace and OfferUp maps have not been checked against
+# live responses yet, so both sites still render with 'playwright'; set
+# their method to 'playwright_json' once the paths are confirmed.
+
 FAST_SITES = [
     {
         'name': 'Facebook Marketplace',
@@ -10,6 +54,18 @@ FAST_SITES = [
         'search_path': '/marketplace/search',
         'params': {'query': '{keyword}', 'radius': '{radius}', 'latitude': '{lat}', 'longitude': '{lon}'},
         'method': 'playwright',
+        'json_capture': {
+            'url_pattern': '*facebook.com/api/graphql*',
+            'items_path': 'data.marketplace_search.feed_units.edges',
+            'fields': {
+                'id': 'node.listing.id',
+                'title': 'node.listing.marketplace_listing_title',
+                'price': 'node.listing.listing_price.amount',
+                'location': 'node.listing.location.reverse_geocode.city_page.display_name',
+                'imageUrl': 'node.listing.primary_listing_photo.image.uri'
+            },
+            'url_template': 'https://www.facebook.com/marketplace/item/{id}/'
+        },
         'selectors': {
             'container': 'div[data-testid="marketplace-search-result"]',
             'title': 'span',
@@ -18,7 +74,12 @@ FAST_SITES = [
             'url': 'a[href]'
         },
         'delay': 3,
+        'timeout': 15,
+        'rate_limit': {'per_second': 0.2, 'burst': 1},
         'max_pages': 2,
+        'block_resources': LEAN_BLOCKED_RESOURCES,
+        'block_patterns': TRACKER_URL_PATTERNS,
+        'wait_for_container': True,
         'private_filter': True
     },
     {
@@ -35,7 +96,10 @@ FAST_SITES = [
             'url': 'a.result-title'
         },
         'delay': 2,
+        'timeout': 10,
+        'rate_limit': {'per_second': 0.33, 'burst': 2},
         'max_pages': 3,
+        'pagination': {'param': 's', 'start': 0, 'step': 120},
         'private_filter': True
     },
     {
@@ -52,7 +116,9 @@ FAST_SITES = [
             'url': 'a.s-item__link'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 3,
+        'pagination': {'param': '_pgn', 'start': 1, 'step': 1},
         'private_filter': False
     },
     {
@@ -61,6 +127,18 @@ FAST_SITES = [
         'search_path': '/search',
         'params': {'q': '{keyword}', 'max_price': '{maxPrice}'},
         'method': 'playwright',
+        'json_capture': {
+            'url_pattern': '*offerup.com/api/graphql*',
+            'items_path': 'data.modularFeed.looseTiles',
+            'fields': {
+                'id': 'listing.listingId',
+                'title': 'listing.title',
+                'price': 'listing.price',
+                'location': 'listing.locationName',
+                'imageUrl': 'listing.image.url'
+            },
+            'url_template': 'https://offerup.com/item/detail/{id}'
+        },
         'selectors': {
             'container': 'div[data-testid="listing-card"]',
             'title': 'h2',
@@ -69,7 +147,12 @@ FAST_SITES = [
             'url': 'a'
         },
         'delay': 3,
+        'timeout': 15,
+        'rate_limit': {'per_second': 0.25, 'burst': 1},
         'max_pages': 2,
+        'block_resources': LEAN_BLOCKED_RESOURCES,
+        'block_patterns': TRACKER_URL_PATTERNS,
+        'wait_for_container': True,
         'private_filter': True
     },
     {
@@ -86,7 +169,9 @@ FAST_SITES = [
             'url': 'a.item-card'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 3,
+        'pagination': {'param': 'firstRecord', 'start': 0, 'step': 25},
         'private_filter': True
     },
     {
@@ -103,7 +188,9 @@ FAST_SITES = [
             'url': 'a.vehicle-card-link'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 3,
+        'pagination': {'param': 'page', 'start': 1, 'step': 1},
         'private_filter': False
     },
     {
@@ -120,7 +207,9 @@ FAST_SITES = [
             'url': 'a.car-blade-link'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 3,
+        'pagination': {'param': 'offset', 'start': 0, 'step': 15},
         'private_filter': False
     },
     {
@@ -137,7 +226,9 @@ FAST_SITES = [
             'url': 'a[data-test="usedListing"]'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 2,
+        'pagination': {'param': 'page', 'start': 1, 'step': 1},
         'private_filter': False
     },
     {
@@ -154,7 +245,9 @@ FAST_SITES = [
             'url': 'a.listing-link'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 3,
+        'pagination': {'param': 'page', 'start': 1, 'step': 1},
         'private_filter': False
     },
     {
@@ -171,7 +264,9 @@ FAST_SITES = [
             'url': 'a.listing-link'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 2,
+        'pagination': {'param': 'page', 'start': 1, 'step': 1},
         'private_filter': False
     }
 ]
@@ -192,7 +287,9 @@ FULL_SITES = FAST_SITES + [
             'url': 'a'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 2,
+        'pagination': {'param': 'pagenumber', 'start': 1, 'step': 1},
         'private_filter': False
     },
     {
@@ -209,7 +306,9 @@ FULL_SITES = FAST_SITES + [
             'url': 'a'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 2,
+        'pagination': {'param': 'page', 'start': 1, 'step': 1},
         'private_filter': True
     },
     {
@@ -226,6 +325,7 @@ FULL_SITES = FAST_SITES + [
             'url': 'a'
         },
         'delay': 3,
+        'timeout': 10,
         'max_pages': 2,
         'private_filter': True
     },
@@ -243,6 +343,7 @@ FULL_SITES = FAST_SITES + [
             'url': 'a'
         },
         'delay': 3,
+        'timeout': 10,
         'max_pages': 2,
         'private_filter': True
     },
@@ -260,7 +361,9 @@ FULL_SITES = FAST_SITES + [
             'url': 'a'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 2,
+        'pagination': {'param': 'page', 'start': 1, 'step': 1},
         'private_filter': False
     },
     {
@@ -277,7 +380,9 @@ FULL_SITES = FAST_SITES + [
             'url': 'a'
         },
         'delay': 2,
+        'timeout': 10,
         'max_pages': 2,
+        'pagination': {'param': 'page', 'start': 1, 'step': 1},
         'private_filter': False
     },
     # Add 20+ more sites (Vroom, AutoNation, CarsDirect, UsedCars, Kijiji, etc.)
@@ -43,6 +43,8 @@ export const searchVehicles = async (
           
           if (data.type === 'progress' && onProgress) {
             onProgress(data.current, data.total, data.site);
+          } else if (data.type === 'results') {
+            vehicles.push(...data.vehicles);
           } else if (data.type === 'result') {
             vehicles.push(data.vehicle);
           }
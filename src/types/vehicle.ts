@@ -5,9 +5,10 @@ export interface Vehicle {
   price: number;
   location: string;
   url: string;
-  imageUrl?: string;
-  description?: string;
+  imageUrl?: string | null;
+  description?: string | null;
   timestamp: string;
+  distance?: number | null; // miles from the search ZIP code, when known
 }
 
 export interface SearchParams {
@@ -25,7 +26,9 @@ export interface SearchParams {
   condition?: string;
   fuelTypes?: string[];
   privateOnly?: boolean;
-  searchMode?: 'fast' | 'full';
+  searchMode?: 'fast' | 'full' | 'instant';
+  deadlineMs?: number;
+  targetResults?: number;
 }
 
 export interface SearchProgress {
@@ -0,0 +1,135 @@
+"""
+Server-Sent Events encoding and streaming for search events.
+Uses orjson when it is installed (serializes Vehicle dataclasses natively,
+straight to bytes) and falls back to a compact stdlib json encoder.
+Results arriving close together are coalesced into batched events.
+"""
+
+import asyncio
+import json
+import os
+from vehicle import Vehicle
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Result events arriving within this long of the first one are sent as one 'results' event (seconds)
+SSE_FLUSH_INTERVAL = int(os.getenv('SSE_FLUSH_INTERVAL_MS', '100')) / 1000
+
+# Most vehicles in one 'results' event
+SSE_MAX_BATCH = int(os.getenv('SSE_MAX_BATCH', '50'))
+
+# Events buffered per client; a client that falls further behind pauses its event source
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', '256'))
+
+def _default(obj):
+    if isinstance(obj, Vehicle):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_default)
+
+def dumps(obj) -> bytes:
+    """Serialize an event (or any JSON value containing Vehicles) to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _encoder.encode(obj).encode()
+
+def loads(data: bytes):
+    """Parse JSON produced by dumps (Vehicles come back as plain dicts)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def encode_event(event) -> bytes:
+    """One SSE 'data:' frame for an event"""
+    return b'data: ' + dumps(event) + b'\n\n'
+
+_END = object()
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def results_event(vehicles: list, indexed: bool = False) -> dict:
+    event = {'type': 'results', 'vehicles': vehicles}
+    if indexed:
+        event['indexed'] = True
+    return event
+
+async def stream_events(events, batch: bool = True, flush_interval: float = SSE_FLUSH_INTERVAL,
+                        max_batch: int = SSE_MAX_BATCH, queue_size: int = SSE_QUEUE_SIZE):
+    """
+    Encode an async iterator of search events as SSE frames.
+    With batch, consecutive result events are coalesced into 'results'
+    events, flushed after flush_interval or max_batch vehicles, and before
+    any other event so order is kept. Without it every result is sent on
+    its own. Events are read ahead into a bounded queue: a slow client
+    stops the reader instead of growing the buffer.
+    """
+    queue = asyncio.Queue(maxsize=max(1, queue_size))
+
+    async def read():
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(_Failure(e))
+        else:
+            await queue.put(_END)
+        finally:
+            if hasattr(events, 'aclose'):
+                await events.aclose()
+
+    reader = asyncio.create_task(read())
+    loop = asyncio.get_running_loop()
+    pending = []
+    pending_indexed = False
+    flush_at = 0.0
+
+    try:
+        while True:
+            if not pending:
+                item = await queue.get()
+            elif not queue.empty():
+                item = queue.get_nowait()
+            else:
+                try:
+                    item = await asyncio.wait_for(queue.get(), flush_at - loop.time())
+                except asyncio.TimeoutError:
+                    yield encode_event(results_event(pending, pending_indexed))
+                    pending = []
+                    continue
+
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+
+            if batch and item['type'] == 'result':
+                indexed = item.get('indexed', False)
+                if pending and indexed != pending_indexed:
+                    yield encode_event(results_event(pending, pending_indexed))
+                    pending = []
+                if not pending:
+                    flush_at = loop.time() + flush_interval
+                    pending_indexed = indexed
+                pending.append(item['vehicle'])
+
+                if len(pending) >= max_batch:
+                    yield encode_event(results_event(pending, pending_indexed))
+                    pending = []
+                continue
+
+            if pending:
+                yield encode_event(results_event(pending, pending_indexed))
+                pending = []
+            yield encode_event(item)
+
+        if pending:
+            yield encode_event(results_event(pending, pending_indexed))
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
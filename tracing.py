@@ -0,0 +1,195 @@
+"""
+Opt-in per-request tracing for /api/search.
+A Trace is attached to the request's context, where every site task of
+the search inherits it: each site gets a span with its queue, start and
+end times, pages and bytes fetched, stage timings and listing counts.
+The search then ends with a 'trace' event. An optional sampling profiler
+records where the event loop thread spent its time meanwhile.
+"""
+
+import contextvars
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# Let clients ask for a trace (?trace=1 or X-Trace: 1; "profile" adds a CPU profile)
+SEARCH_TRACING = os.getenv('SEARCH_TRACING', '0') == '1'
+
+# When set, trace requests must also send this in an X-Trace-Token header
+SEARCH_TRACE_TOKEN = os.getenv('SEARCH_TRACE_TOKEN', '')
+
+# Time between CPU profile samples
+TRACE_PROFILE_INTERVAL = int(os.getenv('TRACE_PROFILE_INTERVAL_MS', '5')) / 1000
+
+# Functions listed in a trace's CPU profile
+TRACE_PROFILE_TOP = int(os.getenv('TRACE_PROFILE_TOP', '25'))
+
+_current = contextvars.ContextVar('search_trace', default=None)
+
+def current_trace() -> Optional['Trace']:
+    """The trace of the search running in this context, if it asked for one"""
+    return _current.get()
+
+def trace_allowed(token: Optional[str]) -> bool:
+    """Whether a search may be traced: tracing is on and the request has the token, if one is set"""
+    if not SEARCH_TRACING:
+        return False
+    return not SEARCH_TRACE_TOKEN or hmac.compare_digest((token or '').encode(), SEARCH_TRACE_TOKEN.encode())
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+@dataclass(slots=True)
+class SiteSpan:
+    """One site's part of a search; times are seconds since the trace started"""
+    site: str
+    queued: float
+    start: Optional[float] = None
+    end: Optional[float] = None
+    pages: int = 0
+    bytes: int = 0
+    containers: int = 0
+    passed: int = 0
+    sent: int = 0
+    duplicates: int = 0
+    error: Optional[str] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return {
+            'site': self.site,
+            'queuedMs': _ms(self.queued),
+            'startMs': _ms(self.start),
+            'endMs': _ms(self.end),
+            'pages': self.pages,
+            'bytes': self.bytes,
+            'containers': self.containers,
+            'passed': self.passed,
+            'sent': self.sent,
+            'duplicates': self.duplicates,
+            'error': self.error,
+            'stagesMs': {stage: _ms(seconds) for stage, seconds in self.stages.items()}
+        }
+
+class SamplingProfiler:
+    """Samples one thread's Python stack on a timer thread"""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = TRACE_PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = 0
+        self.own = Counter()
+        self.total = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            self.samples += 1
+            self.own[self._label(frame.f_code)] += 1
+            seen = set()
+            while frame is not None:
+                label = self._label(frame.f_code)
+                if label not in seen:  # Count recursive functions once per sample
+                    seen.add(label)
+                    self.total[label] += 1
+                frame = frame.f_back
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='trace-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def to_dict(self, top: int = TRACE_PROFILE_TOP) -> Dict:
+        return {
+            'intervalMs': _ms(self.interval),
+            'samples': self.samples,
+            'functions': [
+                # Ranked by own samples: the event loop frames are in every stack
+                {'function': label, 'self': count, 'total': self.total[label]}
+                for label, count in self.own.most_common(top)
+            ]
+        }
+
+class Trace:
+    """Span timeline (and optional CPU profile) of one search"""
+
+    def __init__(self, profile: bool = False):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.profiler = SamplingProfiler() if profile else None
+        self._token = None
+
+    def _now(self) -> float:
+        return time.perf_counter() - self.started
+
+    def span(self, site: str) -> SiteSpan:
+        span = self.spans.get(site)
+        if span is None:
+            span = self.spans[site] = SiteSpan(site, self._now())
+        return span
+
+    def site_started(self, site: str):
+        self.span(site).start = self._now()
+
+    def site_finished(self, site: str, error: Optional[BaseException] = None):
+        span = self.span(site)
+        span.end = self._now()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+
+    def stage(self, site: str, stage: str, seconds: float):
+        stages = self.span(site).stages
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def page(self, site: str, size: int, containers: int, passed: int):
+        span = self.span(site)
+        span.pages += 1
+        span.bytes += size
+        span.containers += containers
+        span.passed += passed
+
+    def sent(self, site: str, sent: int, duplicates: int):
+        span = self.span(site)
+        span.sent += sent
+        span.duplicates += duplicates
+
+    def start(self):
+        """Attach to the current context (site tasks created afterwards inherit it)"""
+        self._token = _current.set(self)
+        if self.profiler is not None:
+            self.profiler.start()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+
+    def event(self) -> Dict:
+        event = {
+            'type': 'trace',
+            'elapsedMs': _ms(self._now()),
+            'sites': [span.to_dict() for span in sorted(self.spans.values(), key=lambda span: span.queued)]
+        }
+        if self.profiler is not None:
+            event['profile'] = self.profiler.to_dict()
+        return event
@@ -3,8 +3,21 @@ Utility functions for vehicle search and deduplication.
 """
 
 import re
-from rapidfuzz import fuzz
-from typing import List, Dict
+from collections import defaultdict
+import numpy as np
+from rapidfuzz import fuzz, process
+from typing import List, Optional, Tuple
+from geo import geo_index, haversine_miles
+from vehicle import Vehicle
+
+# Listings whose title|price|location signatures score above this are duplicates
+DUPLICATE_THRESHOLD = 85
+
+# Width of the price buckets used to block fuzzy comparisons
+DEDUP_PRICE_BUCKET = 1000
+
+YEAR_PATTERN = re.compile(r'\b(19\d{2}|20\d{2})\b')
+WORD_PATTERN = re.compile(r'[a-z]+')
 
 def extract_number(text: str) -> int:
     """Extract numeric value from price/mileage strings"""
@@ -41,107 +54,263 @@ def validate_zip(zip_code: str) -> bool:
     pattern = r'^\d{5}(-\d{4})?$'
     return bool(re.match(pattern, zip_code))
 
-def passes_filters(vehicle: Dict, params) -> bool:
-    """Apply search filters to vehicle listing"""
-    
-    # Price filter
-    if vehicle['price'] > params.maxPrice:
-        return False
-    
-    if vehicle['price'] < 100:  # Skip obviously wrong prices
+DEALER_KEYWORDS = ['dealer', 'dealership', 'auto sales', 'motors inc']
+
+FUEL_KEYWORDS = {
+    'Electric': ['electric', 'ev', 'tesla'],
+    'Hybrid': ['hybrid', 'plug-in'],
+    'Diesel': ['diesel', 'tdi'],
+}
+
+def keyword_matcher(keywords: List[str]):
+    """
+    Single callable reporting whether text contains any of the keywords.
+    Keywords that contain a shorter keyword are dropped since the shorter
+    one always matches first. Plain substring scans beat a regex
+    alternation on titles this short.
+    """
+    unique = set(keywords)
+    needles = tuple(sorted(
+        keyword for keyword in unique
+        if not any(other != keyword and other in keyword for other in unique)
+    ))
+
+    def matches(text: str) -> bool:
+        for needle in needles:
+            if needle in text:
+                return True
         return False
-    
-    # Private seller filter
-    if params.privateOnly:
-        dealer_keywords = ['dealer', 'dealership', 'auto sales', 'motors inc']
-        title_lower = vehicle.get('title', '').lower()
-        location_lower = vehicle.get('location', '').lower()
-        
-        for keyword in dealer_keywords:
-            if keyword in title_lower or keyword in location_lower:
+
+    return matches
+
+class CompiledFilters:
+    """
+    Search filters compiled once per search into a listing predicate.
+    Checks run cheapest first: price, make/model substrings, year, body
+    style, fuel type, then the dealer keywords.
+    """
+
+    def __init__(self, params):
+        self.max_price = params.maxPrice
+        self.terms = [term.lower() for term in (params.make, params.model) if term]
+
+        self.min_year = params.minYear
+        self.max_year = params.maxYear
+        self.check_year = bool(params.minYear or params.maxYear)
+
+        self.body_match = keyword_matcher([style.lower() for style in params.bodyStyles]) if params.bodyStyles else None
+
+        self.fuel_match = None
+        if params.fuelTypes and params.fuelTypes != ['Gas']:
+            keywords = []
+            for fuel_type in params.fuelTypes:
+                keywords.extend(FUEL_KEYWORDS.get(fuel_type, [fuel_type.lower()]))
+            self.fuel_match = keyword_matcher(keywords)
+
+        self.dealer_match = keyword_matcher(DEALER_KEYWORDS) if params.privateOnly else None
+
+    def __call__(self, vehicle: Vehicle) -> bool:
+        price = vehicle.price
+        if price > self.max_price or price < 100:  # Skip obviously wrong prices
+            return False
+
+        title = vehicle.title or ''
+        title_lower = title.lower()
+
+        for term in self.terms:
+            if term not in title_lower:
                 return False
-    
-    # Make filter
-    if params.make:
-        if params.make.lower() not in vehicle.get('title', '').lower():
+
+        # Year filters (if year is in title)
+        if self.check_year:
+            year_match = YEAR_PATTERN.search(title)
+            if year_match:
+                year = int(year_match.group(1))
+                if self.min_year and year < self.min_year:
+                    return False
+                if self.max_year and year > self.max_year:
+                    return False
+
+        if self.body_match and not self.body_match(title_lower):
             return False
-    
-    # Model filter
-    if params.model:
-        if params.model.lower() not in vehicle.get('title', '').lower():
+
+        if self.fuel_match and not self.fuel_match(title_lower):
             return False
-    
+
+        # Private seller filter
+        if self.dealer_match:
+            if self.dealer_match(title_lower) or self.dealer_match((vehicle.location or '').lower()):
+                return False
+
+        return True
+
+    def filter(self, vehicles: List[Vehicle]) -> List[Vehicle]:
+        """Return the listings that pass, in order"""
+        return [vehicle for vehicle in vehicles if vehicle and self(vehicle)]
+
+def compile_filters(params) -> CompiledFilters:
+    """Compile SearchParams into a reusable listing predicate"""
+    return CompiledFilters(params)
+
+def passes_filters(vehicle: Vehicle, params) -> bool:
+    """
+    Apply search filters to a single listing without compiling them.
+    Same checks as CompiledFilters; use compile_filters() for many listings.
+    """
+    if vehicle.price > params.maxPrice or vehicle.price < 100:  # Skip obviously wrong prices
+        return False
+
+    title = vehicle.title or ''
+    title_lower = title.lower()
+
+    for term in (params.make, params.model):
+        if term and term.lower() not in title_lower:
+            return False
+
     # Year filters (if year is in title)
     if params.minYear or params.maxYear:
-        years = re.findall(r'\b(19\d{2}|20\d{2})\b', vehicle.get('title', ''))
-        if years:
-            year = int(years[0])
+        year_match = YEAR_PATTERN.search(title)
+        if year_match:
+            year = int(year_match.group(1))
             if params.minYear and year < params.minYear:
                 return False
             if params.maxYear and year > params.maxYear:
                 return False
-    
-    # Body style filter
-    if params.bodyStyles:
-        title_lower = vehicle.get('title', '').lower()
-        has_match = any(style.lower() in title_lower for style in params.bodyStyles)
-        if not has_match:
-            return False
-    
-    # Fuel type filter
-    if params.fuelTypes:
-        title_lower = vehicle.get('title', '').lower()
-        fuel_keywords = {
-            'Electric': ['electric', 'ev', 'tesla'],
-            'Hybrid': ['hybrid', 'plug-in'],
-            'Diesel': ['diesel', 'tdi'],
-        }
-        
-        has_match = False
-        for fuel_type in params.fuelTypes:
-            keywords = fuel_keywords.get(fuel_type, [fuel_type.lower()])
-            if any(kw in title_lower for kw in keywords):
-                has_match = True
-                break
-        
-        if not has_match and params.fuelTypes != ['Gas']:
+
+    if params.bodyStyles and not any(style.lower() in title_lower for style in params.bodyStyles):
+        return False
+
+    if params.fuelTypes and params.fuelTypes != ['Gas']:
+        if not any(
+            keyword in title_lower
+            for fuel_type in params.fuelTypes
+            for keyword in FUEL_KEYWORDS.get(fuel_type, [fuel_type.lower()])
+        ):
             return False
-    
+
+    # Private seller filter
+    if params.privateOnly:
+        location_lower = (vehicle.location or '').lower()
+        for keyword in DEALER_KEYWORDS:
+            if keyword in title_lower or keyword in location_lower:
+                return False
+
     return True
 
-def deduplicate_vehicles(vehicles: List[Dict]) -> List[Dict]:
+def filter_vehicles(vehicles: List[Vehicle], params) -> List[Vehicle]:
+    """Filter a whole batch of listings, compiling the search filters once"""
+    return compile_filters(params).filter(vehicles)
+
+def listing_signature(vehicle: Vehicle) -> str:
+    """Normalized title|price|location string used for duplicate matching"""
+    title = ' '.join(str(vehicle.title or '').lower().split())
+    location = ' '.join(str(vehicle.location or '').lower().split())
+    return f"{title}|{vehicle.price or 0}|{location}"
+
+def listing_block(vehicle: Vehicle) -> Tuple[int, Optional[str], Optional[str]]:
+    """Blocking key (price bucket, year, make token) - only listings sharing a year/make are compared"""
+    title = str(vehicle.title or '').lower()
+    year_match = YEAR_PATTERN.search(title)
+    year = year_match.group(1) if year_match else None
+
+    word_match = WORD_PATTERN.search(title)
+    make = word_match.group(0) if word_match else None
+
+    return (vehicle.price or 0) // DEDUP_PRICE_BUCKET, year, make
+
+class DedupIndex:
+    """
+    Incremental duplicate detector for a stream of listings.
+    Exact URL/signature matches are caught with set lookups; everything else
+    is fuzzy-matched only against listings in the same or adjacent price
+    bucket with the same year and make, in one vectorized cdist call per block.
+    """
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._urls = set()
+        self._signatures = set()
+        self._blocks = defaultdict(list)  # block key -> signatures
+        self.seen = 0
+        self.unique = 0
+
+    def _candidates(self, block: Tuple[int, Optional[str], Optional[str]]) -> List[str]:
+        bucket, year, make = block
+        candidates = []
+        for neighbour in (bucket - 1, bucket, bucket + 1):
+            candidates.extend(self._blocks.get((neighbour, year, make), ()))
+        return candidates
+
+    def _keep(self, vehicle: Vehicle, signature: str, block):
+        url = vehicle.url
+        if url:
+            self._urls.add(url.rstrip('/'))
+        self._signatures.add(signature)
+        self._blocks[block].append(signature)
+        self.unique += 1
+
+    def add(self, vehicle: Vehicle) -> bool:
+        """Index a single listing, returning False if it duplicates one already seen"""
+        return bool(self.add_batch([vehicle]))
+
+    def add_batch(self, vehicles: List[Vehicle]) -> List[Vehicle]:
+        """Index a batch of listings and return the ones that are not duplicates, in order"""
+        self.seen += len(vehicles)
+        groups = defaultdict(list)  # block key -> [(position, vehicle, signature)]
+        batch_signatures = set()
+
+        # Cheap exact checks first
+        for position, vehicle in enumerate(vehicles):
+            url = vehicle.url
+            if url and url.rstrip('/') in self._urls:
+                continue
+
+            signature = listing_signature(vehicle)
+            if signature in self._signatures or signature in batch_signatures:
+                continue
+
+            batch_signatures.add(signature)
+            groups[listing_block(vehicle)].append((position, vehicle, signature))
+
+        kept = []
+        for block, members in groups.items():
+            signatures = [signature for _, _, signature in members]
+            keep = np.ones(len(members), dtype=bool)
+
+            candidates = self._candidates(block)
+            if candidates:
+                scores = process.cdist(signatures, candidates, scorer=fuzz.ratio)
+                keep &= scores.max(axis=1) <= self.threshold
+
+            # Within the batch, a listing duplicates any earlier kept listing in its block
+            if len(members) > 1:
+                scores = process.cdist(signatures, signatures, scorer=fuzz.ratio)
+                for i in range(1, len(members)):
+                    if keep[i] and (scores[i, :i][keep[:i]] > self.threshold).any():
+                        keep[i] = False
+
+            for (position, vehicle, signature), unique in zip(members, keep):
+                if unique:
+                    self._keep(vehicle, signature, block)
+                    kept.append((position, vehicle))
+
+        kept.sort(key=lambda item: item[0])
+        return [vehicle for _, vehicle in kept]
+
+def deduplicate_vehicles(vehicles: List[Vehicle]) -> List[Vehicle]:
     """
     Remove duplicate listings using fuzzy string matching.
     Compares title + price + location with 85% similarity threshold.
     """
-    unique = []
-    
-    for vehicle in vehicles:
-        signature = f"{vehicle['title']}|{vehicle['price']}|{vehicle['location']}"
-        
-        is_duplicate = False
-        for existing in unique:
-            existing_sig = f"{existing['title']}|{existing['price']}|{existing['location']}"
-            
-            # Fuzzy match with 85% threshold
-            similarity = fuzz.ratio(signature, existing_sig)
-            if similarity > 85:
-                is_duplicate = True
-                break
-        
-        if not is_duplicate:
-            unique.append(vehicle)
-    
-    return unique
+    return DedupIndex().add_batch(vehicles)
 
 def format_price(price: int) -> str:
     """Format price as currency string"""
     return f"${price:,}"
 
-def calculate_distance(zip1: str, zip2: str) -> float:
-    """
-    Calculate distance between ZIP codes (placeholder).
-    In production, use a geocoding API like Google Maps or Mapbox.
-    """
-    # TODO: Implement actual distance calculation
-    return 0.0
+def calculate_distance(zip1: str, zip2: str) -> Optional[float]:
+    """Miles between two ZIP code centroids (offline table, see geo), or None if either is unknown"""
+    points = geo_index.locate([zip1, zip2])
+    if np.isnan(points).any():
+        return None
+    return float(haversine_miles(points[0, 0], points[0, 1], points[1:, 0], points[1:, 1])[0])
@@ -0,0 +1,32 @@
+"""
+Compact vehicle listing type shared by every scraper and API client.
+A slots dataclass: no per-instance __dict__, attribute access instead of
+string-keyed lookups, and orjson serializes it natively.
+"""
+
+from dataclasses import dataclass, fields
+from typing import Dict, Optional
+
+@dataclass(slots=True)
+class Vehicle:
+    id: str
+    source: str
+    title: str
+    price: int
+    location: str
+    url: str
+    imageUrl: Optional[str] = None
+    description: Optional[str] = None
+    timestamp: Optional[str] = None
+    distance: Optional[float] = None  # Miles from the search's ZIP code, when both are known
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in FIELD_NAMES}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Vehicle':
+        """Build a Vehicle from a dict, ignoring unknown keys"""
+        return cls(**{name: data[name] for name in FIELD_NAMES if name in data})
+
+
+FIELD_NAMES = tuple(field.name for field in fields(Vehicle))